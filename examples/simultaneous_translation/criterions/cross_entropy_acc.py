@@ -12,6 +12,17 @@ import torch
 import torch.nn.functional as F
 from fairseq import utils
 from fairseq.criterions import FairseqCriterion, register_criterion
+from examples.simultaneous_translation.utils.latency import (
+    AverageLagging,
+    AverageProportion,
+    DifferentiableAverageLagging,
+)
+
+LATENCY_METRICS = {
+    "average_lagging": AverageLagging,
+    "average_proportion": AverageProportion,
+    "differentiable_average_lagging": DifferentiableAverageLagging,
+}
 
 
 @register_criterion("cross_entropy_acc")
@@ -130,5 +141,94 @@ class CrossEntropyWithAccCriterion(FairseqCriterion):
 
 
 @register_criterion("latency_augmented_cross_entropy_acc")
-class LatencyAugmentedCrossEntropyWithAccCriterion(FairseqCriterion):
-    pass
+class LatencyAugmentedCrossEntropyWithAccCriterion(CrossEntropyWithAccCriterion):
+    """
+    Cross entropy with a latency regulariser computed from the expected
+    delays of the attention:
+
+        delays_i = sum_j j * attn_ij
+
+    with j from 1 to the number of (subsampled) encoder states. The latency
+    is computed on the padded tgt_len x bsz delays of the whole batch and
+    summed over the sentences.
+    """
+
+    def __init__(self, args, task):
+        super().__init__(args, task)
+        self.latency_weight = args.latency_weight
+        self.latency_metric = LATENCY_METRICS[args.latency_metric]()
+
+    @staticmethod
+    def add_args(parser):
+        parser.add_argument(
+            "--latency-weight",
+            type=float,
+            default=0.0,
+            help="Weight of the latency regulariser",
+        )
+        parser.add_argument(
+            "--latency-metric",
+            type=str,
+            default="differentiable_average_lagging",
+            choices=list(LATENCY_METRICS.keys()),
+            help="Latency metric of the regulariser",
+        )
+
+    def compute_latency(self, net_output, target):
+        """
+        Returns:
+            latency of each sentence, 1 x bsz
+        """
+        # bsz x tgt_len x src_len
+        attn = net_output[1]["attn"]
+        bsz, tgt_len, src_len = attn.size()
+
+        steps = torch.arange(1, src_len + 1).type_as(attn)
+        # tgt_len x bsz
+        expected_delays = (attn * steps).sum(dim=2).t()
+
+        # src_len x bsz
+        encoder_padding_mask = net_output[1]["encoder_padding_mask"]
+        if encoder_padding_mask is not None:
+            src_lens = src_len - encoder_padding_mask.long().sum(dim=0, keepdim=True)
+        else:
+            src_lens = attn.new_full((1, bsz), src_len)
+
+        target_padding_mask = target.view(bsz, tgt_len).t() == self.padding_idx
+
+        return self.latency_metric(
+            expected_delays,
+            src_lens.type_as(attn),
+            target_padding_mask,
+            batch_first=False,
+            start_from_zero=False,
+        )
+
+    def forward(self, model, sample, reduction="sum", log_probs=True):
+        net_output = model(**sample["net_input"])
+        target = model.get_targets(sample, net_output)
+        lprobs, loss = self.compute_loss(
+            model, net_output, target, reduction, log_probs
+        )
+        sample_size, logging_output = self.get_logging_output(
+            sample, target, lprobs, loss
+        )
+
+        latency = self.compute_latency(net_output, target)
+        logging_output["latency"] = utils.item(latency.sum().data)
+        if self.latency_weight > 0:
+            loss = loss + self.latency_weight * latency.sum()
+            logging_output["loss"] = utils.item(loss.data)
+
+        return loss, sample_size, logging_output
+
+    @staticmethod
+    def aggregate_logging_outputs(logging_outputs):
+        """Aggregate logging outputs from data parallel training."""
+        agg_output = CrossEntropyWithAccCriterion.aggregate_logging_outputs(
+            logging_outputs
+        )
+        latency_sum = sum(log.get("latency", 0) for log in logging_outputs)
+        nsentences = agg_output["nsentences"]
+        agg_output["latency"] = latency_sum / nsentences if nsentences > 0 else 0.0
+        return agg_output
@@ -3,12 +3,13 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-import os
 import numpy as np
+import torch
 from fairseq.data import FairseqDataset
+from fairseq.data import data_utils as fairseq_data_utils
 
-from . import data_utils
 from .collaters import Seq2SeqCollater
+from .feature_store import compute_fbank, compute_fbank_from_samples
 
 
 class AstDataset(FairseqDataset):
@@ -20,19 +21,31 @@ class AstDataset(FairseqDataset):
         aud_durations_ms (List[int]): A list of int containing the durations of
             audio files.
         tgt (List[torch.LongTensor]): A list of LongTensors containing the indices
-            of target transcriptions.
+            of target transcriptions. It can also be a sequence with a
+            ``sizes`` array, e.g. TargetsWithEos.
         tgt_dict (~fairseq.data.Dictionary): target vocabulary.
         ids (List[str]): A list of utterance IDs.
         speakers (List[str]): A list of speakers corresponding to utterances.
         num_mel_bins (int): Number of triangular mel-frequency bins (default: 80)
         frame_length (float): Frame length in milliseconds (default: 25.0)
         frame_shift (float): Frame shift in milliseconds (default: 10.0)
+        features (FbankFeatures): precomputed features of the utterances,
+            keyed by utterance id (default: None, compute the features)
+        audio (PackedAudio): packed audio of the utterances, keyed by
+            utterance id, read instead of the audio files when the features
+            are computed (default: None)
+        num_buckets (int): Number of buckets of utterances with similar
+            numbers of frames, 0 to keep the order of the utterances
+            (default: 0)
+        shuffle (bool): Shuffle the utterances within each bucket at each
+            epoch (default: False)
     """
 
     def __init__(
         self, aud_paths, aud_durations_ms, tgt,
         tgt_dict, ids, speakers,
-        num_mel_bins=80, frame_length=25.0, frame_shift=10.0
+        num_mel_bins=80, frame_length=25.0, frame_shift=10.0, features=None,
+        num_buckets=0, shuffle=False, audio=None
     ):
         assert frame_length > 0
         assert frame_shift > 0
@@ -50,34 +63,68 @@ class AstDataset(FairseqDataset):
         self.aud_paths = aud_paths
         self.tgt_dict = tgt_dict
         self.tgt = tgt
+        if tgt is not None:
+            self.tgt_sizes = getattr(tgt, "sizes", None)
+            if self.tgt_sizes is None:
+                self.tgt_sizes = [len(t) for t in tgt]
         self.ids = ids
         self.speakers = speakers
         self.num_mel_bins = num_mel_bins
         self.frame_length = frame_length
         self.frame_shift = frame_shift
 
-    def __getitem__(self, index):
-        import torchaudio
-        import torchaudio.compliance.kaldi as kaldi
-        tgt_item = self.tgt[index] if self.tgt is not None else None
+        self.features = features
+        if features is not None:
+            assert features.num_mel_bins == num_mel_bins
+            self.feature_indices = [features.index(i) for i in ids]
+            self.frame_sizes = features.sizes[self.feature_indices].tolist()
+
+        self.audio = audio
+        if audio is not None and features is None:
+            self.audio_indices = [audio.index(i) for i in ids]
 
-        path = self.aud_paths[index]
-        if not os.path.exists(path):
-            raise FileNotFoundError("Audio file not found: {}".format(path))
-        sound, sample_rate = torchaudio.load_wav(path)
-        output = kaldi.fbank(
-            sound,
-            num_mel_bins=self.num_mel_bins,
-            frame_length=self.frame_length,
-            frame_shift=self.frame_shift
-        )
-        output_cmvn = data_utils.apply_mv_norm(output)
         self.s2s_collater = Seq2SeqCollater(
             0, 1, pad_index=self.tgt_dict.pad(),
             eos_index=self.tgt_dict.eos(), move_eos_to_beginning=True
         )
 
-        return {"id": index, "data": [output_cmvn.detach(), tgt_item]}
+        self.num_buckets = num_buckets
+        self.shuffle = shuffle
+        self.epoch = 0
+        if num_buckets > 0:
+            frame_sizes = np.array(self.frame_sizes)
+            # Buckets with the same number of utterances
+            boundaries = np.unique(
+                np.percentile(frame_sizes, np.linspace(0, 100, num_buckets + 1)[1:-1])
+            )
+            self.buckets = np.searchsorted(boundaries, frame_sizes, side='right')
+
+    def __getitem__(self, index):
+        tgt_item = self.tgt[index] if self.tgt is not None else None
+
+        if self.features is not None:
+            output_cmvn = torch.from_numpy(
+                np.array(
+                    self.features[self.feature_indices[index]], dtype=np.float32
+                )
+            )
+        elif self.audio is not None:
+            output_cmvn = compute_fbank_from_samples(
+                self.audio[self.audio_indices[index]],
+                sample_rate=self.audio.sample_rate,
+                num_mel_bins=self.num_mel_bins,
+                frame_length=self.frame_length,
+                frame_shift=self.frame_shift
+            )
+        else:
+            output_cmvn = compute_fbank(
+                self.aud_paths[index],
+                num_mel_bins=self.num_mel_bins,
+                frame_length=self.frame_length,
+                frame_shift=self.frame_shift
+            )
+
+        return {"id": index, "data": [output_cmvn, tgt_item]}
 
     def __len__(self):
         return len(self.aud_paths)
@@ -101,10 +148,36 @@ class AstDataset(FairseqDataset):
         filtering a dataset with ``--max-positions``."""
         return (
             self.frame_sizes[index],
-            len(self.tgt[index]) if self.tgt is not None else 0,
+            int(self.tgt_sizes[index]) if self.tgt is not None else 0,
         )
 
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
     def ordered_indices(self):
         """Return an ordered list of indices. Batches will be constructed based
         on this order."""
-        return np.arange(len(self))
+        if self.num_buckets == 0:
+            return np.arange(len(self))
+
+        if self.shuffle:
+            # np.random is seeded by the task, mix the seed with the epoch to
+            # shuffle differently at each epoch
+            with fairseq_data_utils.numpy_seed(np.random.randint(2 ** 31), self.epoch):
+                indices = np.random.permutation(len(self))
+        else:
+            indices = np.arange(len(self))
+        # Stable sort, the utterances of each bucket stay shuffled
+        return indices[np.argsort(self.buckets[indices], kind='mergesort')]
+
+    def padding_ratio(self, batches):
+        """Ratio of padded frames in the batches"""
+        num_frames = 0
+        num_padded_frames = 0
+        for batch in batches:
+            sizes = [self.frame_sizes[i] for i in batch]
+            num_frames += sum(sizes)
+            num_padded_frames += max(sizes) * len(sizes)
+        if num_padded_frames == 0:
+            return 0.0
+        return 1.0 - num_frames / num_padded_frames
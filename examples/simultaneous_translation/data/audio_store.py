@@ -0,0 +1,152 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Memory-mapped access to audio samples, either from individual wav files or
+from a packed corpus where the samples of all the utterances are stored in a
+single file (<prefix>.bin) with an index of their offsets (<prefix>.idx).
+"""
+
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from examples.simultaneous_translation.data.indexed_arrays import (
+    IndexedArrays, IndexedArraysWriter
+)
+
+WAV_FORMAT_PCM = 1
+WAV_FORMAT_IEEE_FLOAT = 3
+WAV_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _wav_data_layout(path):
+    """
+    Parse the RIFF header of a wav file.
+
+    Returns:
+        (format_tag, channels, bits_per_sample, data_offset, data_size),
+        or None if the file is not a RIFF/WAVE file
+    """
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            return None
+
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(chunk_size - 16 + chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    return None
+                format_tag, channels, _, _, _, bits_per_sample = fmt
+                return format_tag, channels, bits_per_sample, f.tell(), chunk_size
+            else:
+                # chunks are word aligned
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def read_wav_mmap(path, dtype='int16'):
+    """
+    Return the samples of a wav file as a read-only memory-mapped array,
+    (num_samples,) for mono or (num_samples, channels) otherwise.
+    The file is read with soundfile when the samples are not stored as
+    the requested dtype.
+    """
+    dtype = np.dtype(dtype)
+    layout = _wav_data_layout(path)
+    if layout is not None:
+        format_tag, channels, bits_per_sample, data_offset, data_size = layout
+        if format_tag == WAV_FORMAT_EXTENSIBLE:
+            # The sub format is not checked, assume integer pcm samples
+            # unless 32 bits float samples are requested
+            format_tag = (
+                WAV_FORMAT_IEEE_FLOAT if dtype.kind == 'f' else WAV_FORMAT_PCM
+            )
+        stored_kind = 'f' if format_tag == WAV_FORMAT_IEEE_FLOAT else 'i'
+        if (
+            format_tag in [WAV_FORMAT_PCM, WAV_FORMAT_IEEE_FLOAT]
+            and stored_kind == dtype.kind
+            and bits_per_sample == 8 * dtype.itemsize
+        ):
+            num_samples = data_size // (dtype.itemsize * channels)
+            shape = (num_samples,) if channels == 1 else (num_samples, channels)
+            return np.memmap(
+                path, dtype=dtype.newbyteorder('<'), mode='r',
+                offset=data_offset, shape=shape
+            )
+
+    import soundfile as sf
+    samples, _ = sf.read(path, dtype=dtype.name)
+    return samples
+
+
+class PackedAudio(IndexedArrays):
+    """
+    Read-only memory-mapped corpus of audio samples.
+
+    Args:
+        prefix_path (str): the corpus is stored in <prefix_path>.bin and
+            <prefix_path>.idx, see PackedAudioWriter
+    """
+
+    @property
+    def sample_rate(self):
+        return self.metadata["sample_rate"]
+
+
+class PackedAudioWriter(IndexedArraysWriter):
+    """
+    Write the samples of many utterances to <prefix_path>.bin, and their
+    keys, offsets and sizes to <prefix_path>.idx when finalized.
+    """
+
+    def __init__(self, prefix_path, dtype='int16', sample_rate=16000):
+        super().__init__(
+            prefix_path, dtype, metadata={"sample_rate": sample_rate}
+        )
+
+
+def pack_audio_from_json(data_json_path, prefix_path, dtype='int16'):
+    """Pack the audio of all the utterances of a data json, keyed by utterance id."""
+    with open(data_json_path) as f:
+        utterances = json.load(f)["utts"]
+
+    writer = None
+    for utt_id, utterance in utterances.items():
+        samples = read_wav_mmap(utterance["input"]["path"], dtype)
+        if writer is None:
+            import soundfile as sf
+            writer = PackedAudioWriter(
+                prefix_path, dtype,
+                sf.info(utterance["input"]["path"]).samplerate
+            )
+        writer.add_item(utt_id, samples)
+
+    if writer is None:
+        writer = PackedAudioWriter(prefix_path, dtype)
+    writer.finalize()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pack the audio of a data json into a single file"
+    )
+    parser.add_argument("--data-json", required=True,
+                        help="data json, see train_spm.py")
+    parser.add_argument("--output-prefix", required=True,
+                        help="write <output-prefix>.bin and <output-prefix>.idx")
+    parser.add_argument("--dtype", default="int16",
+                        help="data type of the samples")
+    args = parser.parse_args()
+    pack_audio_from_json(args.data_json, args.output_prefix, args.dtype)
@@ -0,0 +1,166 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Offline filter bank features. The normalized features of all the utterances
+of a data json are computed once and packed in <prefix>.bin / <prefix>.idx
+(see indexed_arrays.py), which AstDataset reads instead of computing the
+features of each utterance at every epoch.
+
+By default the features of <data>/<split>.json are written to
+<data>/<split>.fbank, where SpeechTranslationTask looks for them.
+"""
+
+import argparse
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from examples.simultaneous_translation.data.data_utils import apply_mv_norm
+from examples.simultaneous_translation.data.indexed_arrays import (
+    IndexedArrays,
+    IndexedArraysWriter,
+    remove_indexed_arrays,
+)
+
+
+def compute_fbank(path, num_mel_bins=80, frame_length=25.0, frame_shift=10.0):
+    """Mean and variance normalized log mel filter bank features of a wav file"""
+    import torchaudio
+
+    if not os.path.exists(path):
+        raise FileNotFoundError("Audio file not found: {}".format(path))
+    sound, sample_rate = torchaudio.load_wav(path)
+    return compute_fbank_from_samples(
+        sound, sample_rate, num_mel_bins, frame_length, frame_shift
+    )
+
+
+def compute_fbank_from_samples(
+    sound, sample_rate=16000, num_mel_bins=80, frame_length=25.0, frame_shift=10.0
+):
+    """
+    Same as compute_fbank, from the samples of an utterance (e.g. from a
+    PackedAudio), with the scale of 16 bits integer samples.
+    """
+    import torch
+    import torchaudio.compliance.kaldi as kaldi
+
+    if not torch.is_tensor(sound):
+        sound = torch.from_numpy(np.asarray(sound, dtype=np.float32))
+    if sound.dim() == 1:
+        sound = sound.unsqueeze(0)
+    output = kaldi.fbank(
+        sound,
+        num_mel_bins=num_mel_bins,
+        frame_length=frame_length,
+        frame_shift=frame_shift,
+        sample_frequency=sample_rate
+    )
+    return apply_mv_norm(output).detach()
+
+
+class FbankFeatures(IndexedArrays):
+    """
+    Read-only memory-mapped features, num_frames x num_mel_bins for each
+    utterance, keyed by utterance id.
+    """
+
+    @property
+    def num_mel_bins(self):
+        return self.dim
+
+    @property
+    def frame_length(self):
+        return self.metadata["frame_length"]
+
+    @property
+    def frame_shift(self):
+        return self.metadata["frame_shift"]
+
+
+def _featurize(utterances, prefix_path, num_mel_bins, frame_length, frame_shift, dtype):
+    writer = IndexedArraysWriter(
+        prefix_path, dtype, dim=num_mel_bins,
+        metadata={"frame_length": frame_length, "frame_shift": frame_shift}
+    )
+    for utt_id, path in utterances:
+        features = compute_fbank(path, num_mel_bins, frame_length, frame_shift)
+        writer.add_item(utt_id, features.numpy())
+    writer.finalize()
+
+
+def featurize_from_json(
+    data_json_path, prefix_path, num_mel_bins=80, frame_length=25.0,
+    frame_shift=10.0, dtype='float16', num_workers=1
+):
+    """
+    Compute the features of all the utterances of a data json. The
+    utterances are split in num_workers chunks, featurized in parallel and
+    merged in prefix_path.
+    """
+    with open(data_json_path) as f:
+        utterances = [
+            (utt_id, utterance["input"]["path"])
+            for utt_id, utterance in json.load(f)["utts"].items()
+        ]
+
+    num_workers = max(min(num_workers, len(utterances)), 1)
+    chunk_size = (len(utterances) + num_workers - 1) // num_workers
+    chunk_prefixes = [
+        "{}.{}".format(prefix_path, i) for i in range(num_workers)
+    ]
+    args = [
+        (
+            utterances[i * chunk_size: (i + 1) * chunk_size],
+            chunk_prefix, num_mel_bins, frame_length, frame_shift, dtype
+        )
+        for i, chunk_prefix in enumerate(chunk_prefixes)
+    ]
+    if num_workers > 1:
+        with Pool(num_workers) as pool:
+            pool.starmap(_featurize, args)
+    else:
+        _featurize(*args[0])
+
+    writer = IndexedArraysWriter(
+        prefix_path, dtype, dim=num_mel_bins,
+        metadata={"frame_length": frame_length, "frame_shift": frame_shift}
+    )
+    for chunk_prefix in chunk_prefixes:
+        writer.merge_file_(chunk_prefix)
+        remove_indexed_arrays(chunk_prefix)
+    writer.finalize()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompute the filter bank features of a data json"
+    )
+    parser.add_argument("--data-json", required=True,
+                        help="data json, see train_spm.py")
+    parser.add_argument("--output-prefix", default=None,
+                        help="write <output-prefix>.bin and <output-prefix>.idx "
+                        "(default: the data json path with .fbank instead of .json)")
+    parser.add_argument("--num-mel-bins", type=int, default=80,
+                        help="number of mel bins, same as --input-feat-per-channel")
+    parser.add_argument("--frame-length", type=float, default=25.0,
+                        help="frame length (ms)")
+    parser.add_argument("--frame-shift", type=float, default=10.0,
+                        help="frame shift (ms)")
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"],
+                        help="data type of the stored features")
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count(),
+                        help="number of processes")
+    args = parser.parse_args()
+
+    output_prefix = args.output_prefix
+    if output_prefix is None:
+        output_prefix = os.path.splitext(args.data_json)[0] + ".fbank"
+
+    featurize_from_json(
+        args.data_json, output_prefix, args.num_mel_bins, args.frame_length,
+        args.frame_shift, args.dtype, args.num_workers
+    )
@@ -0,0 +1,142 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Arrays of many utterances packed in a single file, in the style of
+MMapIndexedDataset. The rows of all the arrays are concatenated in
+<prefix>.bin, and <prefix>.idx is a numpy archive with the key, offset
+and number of rows of each array.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+def data_file_path(prefix_path):
+    return prefix_path + '.bin'
+
+
+def index_file_path(prefix_path):
+    return prefix_path + '.idx'
+
+
+class IndexedArrays(object):
+    """
+    Read-only memory-mapped arrays.
+
+    Args:
+        prefix_path (str): the arrays are stored in <prefix_path>.bin and
+            <prefix_path>.idx, see IndexedArraysWriter
+    """
+
+    def __init__(self, prefix_path):
+        with open(index_file_path(prefix_path), 'rb') as f:
+            index = np.load(f)
+            self.keys = index['keys']
+            self.offsets = index['offsets']
+            self.sizes = index['sizes']
+            self.dtype = np.dtype(str(index['dtype']))
+            self.dim = int(index['dim'])
+            self.metadata = json.loads(str(index['metadata']))
+        self.key_to_index = {key: i for i, key in enumerate(self.keys.tolist())}
+
+        if self.sizes.sum() > 0:
+            self.data = np.memmap(
+                data_file_path(prefix_path), dtype=self.dtype, mode='r'
+            )
+        else:
+            self.data = np.zeros(0, dtype=self.dtype)
+        if self.dim > 0:
+            self.data = self.data.reshape(-1, self.dim)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]: self.offsets[i] + self.sizes[i]]
+
+    def __contains__(self, key):
+        return key in self.key_to_index
+
+    def index(self, key):
+        return self.key_to_index[key]
+
+    def get(self, key):
+        return self[self.key_to_index[key]]
+
+    @staticmethod
+    def exists(prefix_path):
+        return (
+            os.path.exists(index_file_path(prefix_path))
+            and os.path.exists(data_file_path(prefix_path))
+        )
+
+
+class IndexedArraysWriter(object):
+    """
+    Write arrays to <prefix_path>.bin, and their keys, offsets and sizes to
+    <prefix_path>.idx when finalized.
+
+    Args:
+        prefix_path (str): prefix of the output files
+        dtype: data type of the stored arrays
+        dim (int): number of columns of the arrays, 0 for 1-d arrays
+        metadata (dict): json serializable information stored in the index
+    """
+
+    def __init__(self, prefix_path, dtype, dim=0, metadata=None):
+        self.prefix_path = prefix_path
+        self.dtype = np.dtype(dtype)
+        self.dim = dim
+        self.metadata = metadata or {}
+        self.data_file = open(data_file_path(prefix_path), 'wb')
+        self.keys = []
+        self.offsets = []
+        self.sizes = []
+        self.num_rows = 0
+
+    def add_item(self, key, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        if self.dim > 0:
+            assert array.ndim == 2 and array.shape[1] == self.dim
+        self.data_file.write(array.tobytes(order='C'))
+        self.keys.append(key)
+        self.offsets.append(self.num_rows)
+        self.sizes.append(array.shape[0])
+        self.num_rows += array.shape[0]
+
+    def merge_file_(self, another_prefix_path):
+        """Append the arrays of another file."""
+        another = IndexedArrays(another_prefix_path)
+        assert another.dtype == self.dtype and another.dim == self.dim
+        with open(data_file_path(another_prefix_path), 'rb') as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    break
+                self.data_file.write(data)
+        self.keys.extend(another.keys.tolist())
+        self.offsets.extend((another.offsets + self.num_rows).tolist())
+        self.sizes.extend(another.sizes.tolist())
+        self.num_rows += int(another.sizes.sum())
+
+    def finalize(self):
+        self.data_file.close()
+        with open(index_file_path(self.prefix_path), 'wb') as f:
+            np.savez(
+                f,
+                keys=np.array(self.keys, dtype=str),
+                offsets=np.array(self.offsets, dtype=np.int64),
+                sizes=np.array(self.sizes, dtype=np.int64),
+                dtype=np.array(self.dtype.str),
+                dim=np.array(self.dim),
+                metadata=np.array(json.dumps(self.metadata)),
+            )
+
+
+def remove_indexed_arrays(prefix_path):
+    os.remove(data_file_path(prefix_path))
+    os.remove(index_file_path(prefix_path))
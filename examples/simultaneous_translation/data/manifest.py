@@ -0,0 +1,163 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Binary version of the data json of a split (see train_spm.py), which is
+much faster to load than the json:
+
+    <prefix>.tgt.bin, <prefix>.tgt.idx: target token ids (MMapIndexedDataset)
+    <prefix>.npz: utterance ids, speakers, audio paths, durations and
+        target texts (numpy arrays)
+
+By default the manifest of <data>/<split>.json is <data>/<split>.manifest,
+which is used by SpeechTranslationTask and the evaluation scorers instead
+of the json when it exists.
+"""
+
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+import torch
+from fairseq.data import indexed_dataset
+
+
+def manifest_prefix_from_json(data_json_path):
+    return os.path.splitext(data_json_path)[0] + ".manifest"
+
+
+def find_manifest(path):
+    """
+    Prefix of the manifest of a data json, or of the manifest itself if path
+    is a prefix. None if there is no manifest.
+    """
+    if SpeechManifest.exists(path):
+        return path
+    if path.endswith(".json") and SpeechManifest.exists(manifest_prefix_from_json(path)):
+        return manifest_prefix_from_json(path)
+    return None
+
+
+def speaker_from_id(utt_id):
+    m = re.search("(.+?)-(.+?)-(.+?)", utt_id)
+    return m.group(1) + "_" + m.group(2)
+
+
+class SpeechManifest(object):
+    """
+    Utterances of a split, in the order of the data json.
+
+    Attributes:
+        ids, speakers, paths, texts: numpy arrays of str
+        durations_ms: numpy array of int64
+        targets: MMapIndexedDataset of target token ids, without eos
+    """
+
+    def __init__(self, prefix_path):
+        self.prefix_path = prefix_path
+        with open(prefix_path + ".npz", "rb") as f:
+            arrays = np.load(f)
+            self.ids = arrays["ids"]
+            self.speakers = arrays["speakers"]
+            self.paths = arrays["paths"]
+            self.durations_ms = arrays["durations_ms"]
+        self.targets = indexed_dataset.MMapIndexedDataset(prefix_path + ".tgt")
+        self._texts = None
+
+    @property
+    def texts(self):
+        # Only needed for evaluation, loaded on demand
+        if self._texts is None:
+            with open(self.prefix_path + ".npz", "rb") as f:
+                self._texts = np.load(f)["texts"]
+        return self._texts
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def exists(prefix_path):
+        return (
+            os.path.exists(prefix_path + ".npz")
+            and indexed_dataset.MMapIndexedDataset.exists(prefix_path + ".tgt")
+        )
+
+
+class TargetsWithEos(object):
+    """
+    Target token ids of a subset of the utterances of a manifest, as
+    LongTensors with eos appended.
+    """
+
+    def __init__(self, targets, indices, eos):
+        self.targets = targets
+        self.indices = indices
+        self.eos = eos
+        # +1 for eos
+        self.sizes = targets.sizes[indices] + 1
+
+    def __getitem__(self, i):
+        target = self.targets[int(self.indices[i])].long()
+        return torch.cat([target, torch.LongTensor([self.eos])])
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def write_manifest(data_json_path, prefix_path, vocab_size=None):
+    with open(data_json_path, "rb") as f:
+        utterances = json.load(f)["utts"]
+
+    builder = indexed_dataset.make_builder(
+        prefix_path + ".tgt.bin", impl="mmap", vocab_size=vocab_size
+    )
+    for utterance in utterances.values():
+        builder.add_item(
+            torch.LongTensor(
+                [int(i) for i in utterance["output"]["tokenid"].split(", ")]
+            )
+        )
+    builder.finalize(prefix_path + ".tgt.idx")
+
+    with open(prefix_path + ".npz", "wb") as f:
+        np.savez(
+            f,
+            ids=np.array(list(utterances.keys()), dtype=str),
+            speakers=np.array(
+                [speaker_from_id(utt_id) for utt_id in utterances.keys()], dtype=str
+            ),
+            paths=np.array(
+                [u["input"]["path"].strip() for u in utterances.values()], dtype=str
+            ),
+            durations_ms=np.array(
+                [int(u["input"]["length_ms"]) for u in utterances.values()],
+                dtype=np.int64
+            ),
+            texts=np.array(
+                [u["output"]["text"].strip() for u in utterances.values()], dtype=str
+            ),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a data json to a binary manifest"
+    )
+    parser.add_argument("--data-json", required=True,
+                        help="data json, see train_spm.py")
+    parser.add_argument("--output-prefix", default=None,
+                        help="prefix of the manifest files "
+                        "(default: the data json path with .manifest instead of .json)")
+    parser.add_argument("--vocab-size", type=int, default=None,
+                        help="size of the target dictionary, to store the "
+                        "token ids with the smallest data type")
+    args = parser.parse_args()
+
+    write_manifest(
+        args.data_json,
+        args.output_prefix or manifest_prefix_from_json(args.data_json),
+        args.vocab_size
+    )
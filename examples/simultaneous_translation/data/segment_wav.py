@@ -2,27 +2,33 @@ import os
 import json
 import yaml
 import soundfile as sf
-from multiprocessing import cpu_count
+from multiprocessing import Pool, cpu_count
 from itertools import groupby
 from tqdm import tqdm
 import sentencepiece as sp
 import argparse
 
+from examples.simultaneous_translation.data.audio_store import PackedAudioWriter
+from examples.simultaneous_translation.data.indexed_arrays import remove_indexed_arrays
+
 SPLITS = ['train', 'dev', 'tst-COMMON', 'tst-HE']
 
-def segment_wav_files(root, split):
-    in_root = os.path.join(root, split, 'wav')
-    out_root = os.path.join(root, split, 'segmented_wav')
-    if not os.path.isdir(out_root):
-        os.makedirs(out_root)
 
-    yaml_path = os.path.join(root, split, 'txt', f'{split}.yaml')
-    with open(yaml_path) as f:
-        wav_list = yaml.load(f)
+def packed_audio_prefix(root, split):
+    return os.path.join(root, split, 'segmented_audio')
+
 
-    for wav_file_name, g in tqdm(groupby(wav_list, lambda x: x['wav'])):
-        segment_list = list(g)
+def _read_segments(f, segment_list):
+    for s in segment_list:
+        offset, duration = round(s['offset'], 3), round(s['duration'], 3)
+        f.seek(int(offset * f.samplerate))
+        frames_to_read = int(duration * f.samplerate)
+        yield f.read(frames_to_read, dtype='int16')
 
+
+def _segment_talks(in_root, out_root, talks):
+    """Write the segments of each talk to one wav file per segment"""
+    for wav_file_name, segment_list in tqdm(talks):
         wav_file_path = os.path.join(in_root, wav_file_name)
         ted_id = os.path.splitext(wav_file_name)[0].split('_')[1]
         out_dir_path = os.path.join(out_root, ted_id)
@@ -30,11 +36,10 @@ def segment_wav_files(root, split):
             os.makedirs(out_dir_path)
 
         with sf.SoundFile(wav_file_path) as f:
-            sr = f.samplerate
-            for i, s in tqdm(enumerate(segment_list), total=len(segment_list)):
+            for i, s in enumerate(segment_list):
                 offset, duration = round(s['offset'], 3), round(s['duration'], 3)
-                f.seek(int(offset * sr))
-                frames_to_read = int(duration * sr)
+                f.seek(int(offset * f.samplerate))
+                frames_to_read = int(duration * f.samplerate)
                 out_file_name = os.path.splitext(wav_file_name)
                 out_file_name = f'{out_file_name[0]}_{i}{out_file_name[1]}'
                 out_file_path = os.path.join(out_dir_path, out_file_name)
@@ -44,11 +49,101 @@ def segment_wav_files(root, split):
                         format=f.format
                 ) as f_out:
                     f_out.write(f.read(frames_to_read))
+    return len(talks)
+
+
+def _pack_talks(in_root, prefix_path, talks):
+    """
+    Write the segments of the talks to a packed audio file, keyed by the
+    utterance ids of train_spm.py ({ted_id}-{ted_id}-{segment index}).
+    Returns the sample rate of the talks.
+    """
+    writer = None
+    sample_rate = None
+    for wav_file_name, segment_list in tqdm(talks):
+        wav_file_path = os.path.join(in_root, wav_file_name)
+        ted_id = os.path.splitext(wav_file_name)[0].split('_')[1]
+        with sf.SoundFile(wav_file_path) as f:
+            if writer is None:
+                sample_rate = f.samplerate
+                writer = PackedAudioWriter(prefix_path, 'int16', sample_rate)
+            assert f.samplerate == sample_rate
+            for i, samples in enumerate(_read_segments(f, segment_list)):
+                writer.add_item(f'{ted_id}-{ted_id}-{i}', samples)
+    if writer is None:
+        writer = PackedAudioWriter(prefix_path, 'int16')
+    writer.finalize()
+    return sample_rate
+
+
+def segment_wav_files(root, split, num_workers=1, packed=False):
+    """
+    Segment the talks of a split, in num_workers processes. The segments
+    are written to <root>/<split>/segmented_wav/<ted_id>/ted_<ted_id>_<i>.wav,
+    or with packed, to a single packed audio file
+    <root>/<split>/segmented_audio.{bin,idx} (see audio_store.py).
+    """
+    in_root = os.path.join(root, split, 'wav')
+    out_root = os.path.join(root, split, 'segmented_wav')
+
+    yaml_path = os.path.join(root, split, 'txt', f'{split}.yaml')
+    with open(yaml_path) as f:
+        wav_list = yaml.load(f)
+
+    talks = [
+        (wav_file_name, list(g))
+        for wav_file_name, g in groupby(wav_list, lambda x: x['wav'])
+    ]
+
+    # Contiguous chunks of talks, so that the packed chunks can be merged
+    # in the order of the yaml
+    num_chunks = max(min(num_workers, len(talks)), 1)
+    chunk_size = (len(talks) + num_chunks - 1) // num_chunks
+    chunks = [
+        talks[i * chunk_size: (i + 1) * chunk_size] for i in range(num_chunks)
+    ]
+
+    if packed:
+        prefix_path = packed_audio_prefix(root, split)
+        chunk_prefixes = [f'{prefix_path}.{i}' for i in range(num_chunks)]
+        args = [
+            (in_root, chunk_prefix, chunk)
+            for chunk_prefix, chunk in zip(chunk_prefixes, chunks)
+        ]
+        worker = _pack_talks
+    else:
+        if not os.path.isdir(out_root):
+            os.makedirs(out_root)
+        args = [(in_root, out_root, chunk) for chunk in chunks]
+        worker = _segment_talks
+
+    if num_chunks > 1:
+        with Pool(num_chunks) as pool:
+            results = pool.starmap(worker, args)
+    else:
+        results = [worker(*args[0])]
+
+    if packed:
+        sample_rates = set(r for r in results if r is not None)
+        assert len(sample_rates) <= 1, "talks with different sample rates"
+        writer = PackedAudioWriter(
+            prefix_path, 'int16', sample_rates.pop() if sample_rates else 16000
+        )
+        for chunk_prefix in chunk_prefixes:
+            writer.merge_file_(chunk_prefix)
+            remove_indexed_arrays(chunk_prefix)
+        writer.finalize()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--data-path")
+    parser.add_argument("--num-workers", type=int, default=cpu_count(),
+                        help="number of processes, each segmenting a part of the talks")
+    parser.add_argument("--packed", action="store_true",
+                        help="write the segments of each split to a single packed "
+                        "audio file (<data-path>/<split>/segmented_audio.bin and .idx) "
+                        "instead of one wav file per segment")
     args = parser.parse_args()
     for split in SPLITS:
-        segment_wav_files(args.data_path, split)
-
+        segment_wav_files(args.data_path, split, args.num_workers, args.packed)
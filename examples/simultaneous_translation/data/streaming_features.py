@@ -0,0 +1,163 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import torch
+
+
+class OnlineCMVN(object):
+    """
+    Mean and variance normalization with running statistics. Each frame is
+    normalized with the statistics of all the frames seen so far (including
+    itself), so normalized frames never change once they are emitted.
+    """
+
+    def __init__(self, feature_dim, eps=1e-8):
+        self.feature_dim = feature_dim
+        self.eps = eps
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.sum = torch.zeros(self.feature_dim, dtype=torch.float64)
+        self.sum_square = torch.zeros(self.feature_dim, dtype=torch.float64)
+
+    def __call__(self, features):
+        """
+        features: num_frames x feature_dim
+        """
+        num_frames = features.size(0)
+        if num_frames == 0:
+            return features
+
+        features_64 = features.double()
+        # Running statistics after each of the new frames
+        count = self.count + torch.arange(
+            1, num_frames + 1, dtype=torch.float64
+        ).unsqueeze(1)
+        cum_sum = self.sum + features_64.cumsum(dim=0)
+        cum_sum_square = self.sum_square + (features_64 ** 2).cumsum(dim=0)
+
+        mean = cum_sum / count
+        # Unbiased variance, as in data_utils.calc_mean_invstddev
+        var = (
+            (cum_sum_square - count * mean ** 2) / (count - 1).clamp(min=1)
+        ).clamp(min=0)
+        std = torch.sqrt(var)
+        invstddev = torch.where(
+            var < self.eps, 1.0 / (std + self.eps), 1.0 / std.clamp(min=self.eps)
+        )
+
+        self.count += num_frames
+        self.sum = cum_sum[-1]
+        self.sum_square = cum_sum_square[-1]
+
+        return ((features_64 - mean) * invstddev).type_as(features)
+
+
+class StreamingFbank(object):
+    """
+    Incremental log mel filter bank features.
+
+    Incoming samples are kept in a preallocated float32 buffer and only the
+    new 25ms / 10ms frames are computed at each call. As Kaldi computes every
+    frame from its own window (snip_edges), and the features are computed
+    without dithering, the frames are the same as the ones from kaldi.fbank
+    over the whole utterance with dither=0. The features are then normalized
+    with OnlineCMVN.
+
+    Args:
+        num_mel_bins (int): Number of triangular mel-frequency bins
+        frame_length (float): Frame length in milliseconds
+        frame_shift (float): Frame shift in milliseconds
+        sample_rate (int): Sample rate of the audio
+        buffer_size (int): Initial capacity of the sample buffer
+        apply_cmvn (bool): Apply online mean and variance normalization
+    """
+
+    def __init__(
+        self, num_mel_bins=40, frame_length=25.0, frame_shift=10.0,
+        sample_rate=16000, buffer_size=16000, apply_cmvn=True
+    ):
+        self.num_mel_bins = num_mel_bins
+        self.frame_length = frame_length
+        self.frame_shift = frame_shift
+        self.sample_rate = sample_rate
+        self.window_size = int(sample_rate * frame_length / 1000)
+        self.window_shift = int(sample_rate * frame_shift / 1000)
+
+        self.samples = np.zeros(max(buffer_size, self.window_size), dtype=np.float32)
+        self.features = torch.zeros(128, num_mel_bins)
+        self.cmvn = OnlineCMVN(num_mel_bins) if apply_cmvn else None
+        self.reset()
+
+    def reset(self):
+        # Number of unconsumed samples at the beginning of the buffer
+        self.num_samples = 0
+        # Number of frames emitted so far
+        self.num_frames = 0
+        if self.cmvn is not None:
+            self.cmvn.reset()
+
+    def _append_samples(self, samples):
+        end = self.num_samples + len(samples)
+        if end > len(self.samples):
+            new_samples = np.zeros(max(end, 2 * len(self.samples)), dtype=np.float32)
+            new_samples[:self.num_samples] = self.samples[:self.num_samples]
+            self.samples = new_samples
+        self.samples[self.num_samples: end] = samples
+        self.num_samples = end
+
+    def _append_features(self, features):
+        end = self.num_frames + features.size(0)
+        if end > self.features.size(0):
+            new_features = self.features.new_zeros(
+                max(end, 2 * self.features.size(0)), self.num_mel_bins
+            )
+            new_features[:self.num_frames] = self.features[:self.num_frames]
+            self.features = new_features
+        self.features[self.num_frames: end] = features
+        self.num_frames = end
+
+    def get_features(self):
+        """Features of all the samples received so far, num_frames x num_mel_bins"""
+        return self.features[:self.num_frames]
+
+    def __call__(self, samples):
+        """
+        Add new samples and return the features of the new frames,
+        num_new_frames x num_mel_bins
+        """
+        import torchaudio.compliance.kaldi as kaldi
+
+        self._append_samples(np.asarray(samples, dtype=np.float32))
+
+        if self.num_samples < self.window_size:
+            return self.features.new_zeros(0, self.num_mel_bins)
+
+        num_new_frames = 1 + (self.num_samples - self.window_size) // self.window_shift
+        num_used_samples = (num_new_frames - 1) * self.window_shift + self.window_size
+
+        output = kaldi.fbank(
+            torch.from_numpy(self.samples[:num_used_samples]).unsqueeze(0),
+            num_mel_bins=self.num_mel_bins,
+            frame_length=self.frame_length,
+            frame_shift=self.frame_shift,
+            # The noise of the dithering would depend on the chunks
+            dither=0.0
+        )
+
+        if self.cmvn is not None:
+            output = self.cmvn(output)
+
+        # Keep the samples which are needed by the next frames
+        num_consumed = num_new_frames * self.window_shift
+        num_left = self.num_samples - num_consumed
+        self.samples[:num_left] = self.samples[num_consumed: self.num_samples]
+        self.num_samples = num_left
+
+        self._append_features(output)
+
+        return output
@@ -24,7 +24,7 @@ class Agent(object):
     def decode(self, session, low=0, high=100000, num_thread=10):
         corpus_info = session.get_src()
         high = min(corpus_info["num_sentences"] - 1, high)
-        if low >= high:
+        if low > high:
             return
 
         t0 = time.time()
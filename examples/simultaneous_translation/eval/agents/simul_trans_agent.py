@@ -2,8 +2,22 @@ from . agent import Agent
 from . import DEFAULT_EOS, GET, SEND
 from . import register_agent
 import torch
+from torch import nn
 from fairseq import checkpoint_utils, utils, tasks
 import os
+import time
+
+
+def quantize_model(model, dtype=torch.qint8):
+    """
+    Dynamic quantization of the LSTM, LSTMCell and Linear layers of the
+    model (encoder, decoder and energy layers): the weights are stored in
+    int8 and the activations are quantized on the fly. CPU only.
+    """
+    return torch.quantization.quantize_dynamic(
+        model, {nn.LSTM, nn.LSTMCell, nn.Linear}, dtype=dtype
+    )
+
 
 class SimulTransAgent(Agent):
     def __init__(self, args):
@@ -15,12 +29,17 @@ class SimulTransAgent(Agent):
 
         self.max_len = args.max_len
 
+        self.incremental_encoder = args.incremental_encoder
+
+        self.batch_size = args.batch_size
+
         self.eos = DEFAULT_EOS
 
     @staticmethod
     def add_args(parser):
         parser.add_argument('--model-path', type=str, default=None, 
-                            help='path to your pretrained model.')
+                            help='path to your pretrained model, or prefix of an '
+                                 'inference bundle (see utils/inference_bundle.py)')
         parser.add_argument("--data-bin", type=str, required=True,
                             help="Path of data binary")
         parser.add_argument("--user-dir", type=str,
@@ -42,6 +61,16 @@ class SimulTransAgent(Agent):
         parser.add_argument('--model-overrides', default="{}", type=str, metavar='DICT',
                         help='a dictionary used to override model args at generation '
                                 'that were used during model training')
+        parser.add_argument('--incremental-encoder', action='store_true',
+                            help='Only encode the newly read source frames or tokens, '
+                                 'reusing the encoder states cached in the agent states')
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Number of sentences decoded in lockstep. The predictions '
+                                 'of the sentences are batched, as well as the requests '
+                                 'to the server')
+        parser.add_argument('--quantize', action='store_true',
+                            help='Apply dynamic int8 quantization to the LSTM and linear '
+                                 'layers of the model, for inference on CPU')
         return parser
     
     def load_dictionary(self, task):
@@ -51,18 +80,38 @@ class SimulTransAgent(Agent):
         args.user_dir = os.path.join(os.path.dirname(__file__), '..', '..')
         utils.import_user_module(args)
         filename = args.model_path
-        if not os.path.exists(filename):
-            raise IOError("Model file not found: {}".format(filename))
+        quantize = args.quantize
+        model_overrides = eval(args.model_overrides)
 
-        state = checkpoint_utils.load_checkpoint_to_cpu(filename, eval(args.model_overrides))
+        # Importable once the user dir is imported
+        from examples.simultaneous_translation.utils.inference_bundle import (
+            InferenceBundle,
+        )
+        if InferenceBundle.exists(filename):
+            # Inference bundle, see utils/inference_bundle.py. The weights
+            # are memory-mapped instead of loaded.
+            bundle = InferenceBundle(filename)
+            args = bundle.args
+            for arg_name, arg_val in model_overrides.items():
+                setattr(args, arg_name, arg_val)
+            self.model, task = bundle.build_model(args)
+            quantize = quantize or bundle.quantize
+        else:
+            if not os.path.exists(filename):
+                raise IOError("Model file not found: {}".format(filename))
+
+            state = checkpoint_utils.load_checkpoint_to_cpu(filename, model_overrides)
 
-        args = state["args"]
+            args = state["args"]
 
-        task = tasks.setup_task(args)
+            task = tasks.setup_task(args)
 
-        # build model for ensemble
-        self.model = task.build_model(args)
-        self.model.load_state_dict(state["model"], strict=True)
+            # build model for ensemble
+            self.model = task.build_model(args)
+            self.model.load_state_dict(state["model"], strict=True)
+
+        if quantize:
+            self.model = quantize_model(self.model)
 
         # Set dictionary
         self.load_dictionary(task)
@@ -75,7 +124,10 @@ class SimulTransAgent(Agent):
             "steps" : {"src": 0, "tgt": 0},
             "finished" : False,
             "finish_read" : False,
-            "model_states": {}
+            "incremental_encoder": self.incremental_encoder,
+            "model_states": {},
+            # Last word boundary of the target tokens, updated incrementally
+            "word_boundary": self.word_splitter["tgt"].init_boundary_state()
         }
 
     def update_states(self, states, new_state):
@@ -110,7 +162,9 @@ class SimulTransAgent(Agent):
 
     def write_action(self, states):
         token, index = self.model.predict_from_states(states)
+        return self.write_prediction(states, token, index)
 
+    def write_prediction(self, states, token, index):
         if index == self.dict["tgt"].eos() or len(states["tokens"]["tgt"]) > self.max_len:
             # Finish this sentence is predict EOS
             states["finished"] = True
@@ -120,7 +174,9 @@ class SimulTransAgent(Agent):
             states["tokens"]["tgt"] += [token]
             end_idx_last_full_word = (
                 self.word_splitter["tgt"]
-                .end_idx_last_full_word(states["tokens"]["tgt"])
+                .update_end_idx_last_full_word(
+                    states["tokens"]["tgt"], states["word_boundary"]
+                )
             ) 
             self._append_indices(states, [index], "tgt")
 
@@ -147,6 +203,81 @@ class SimulTransAgent(Agent):
     def reset(self):
         pass
 
+    def decode(self, session, low=0, high=100000, num_thread=10):
+        if self.batch_size <= 1:
+            return super().decode(session, low, high, num_thread)
+
+        corpus_info = session.get_src()
+        high = min(corpus_info["num_sentences"] - 1, high)
+        if low > high:
+            return
+
+        t0 = time.time()
+        self._decode_batch(session, low, high)
+        print(f'Finished {low} to {high} in {time.time() - t0}s')
+
+    def _decode_batch(self, session, low, high):
+        """
+        Advance up to batch_size sentences in lockstep. At each step, all
+        the sentences to WRITE are predicted in one batch, and all the reads
+        and writes are sent to the server in one request each.
+        """
+        sent_ids = iter(range(low, high + 1))
+        list_of_states = {}
+        while True:
+            # Start new sentences as soon as others are finished
+            while len(list_of_states) < self.batch_size:
+                sent_id = next(sent_ids, None)
+                if sent_id is None:
+                    break
+                list_of_states[sent_id] = self.init_states()
+
+            if len(list_of_states) == 0:
+                break
+
+            reads = {}
+            writes = []
+            hypos = {}
+            for sent_id, states in list_of_states.items():
+                if states["finished"]:
+                    # Finish the hypo by sending eos to server
+                    hypos[sent_id] = self.finish_action()["value"]
+                elif (
+                    self.model.decision_from_states(states) == 0
+                    and not self.finish_read(states)
+                ):
+                    # READ
+                    action = self.read_action(states)
+                    # None means a buffered token is read
+                    if action is not None:
+                        reads[sent_id] = action["value"]
+                else:
+                    # WRITE
+                    writes.append(sent_id)
+
+            if len(writes) > 0:
+                predictions = self.model.predict_from_states_batch(
+                    [list_of_states[sent_id] for sent_id in writes]
+                )
+                for sent_id, (token, index) in zip(writes, predictions):
+                    action = self.write_prediction(list_of_states[sent_id], token, index)
+                    # None means a subword is predicted
+                    if action is not None:
+                        hypos[sent_id] = action["value"]
+
+            if len(reads) > 0:
+                new_states = session.get_src_batch(reads)
+                for sent_id, new_state in zip(reads.keys(), new_states):
+                    list_of_states[sent_id] = self.update_states(
+                        list_of_states[sent_id], new_state
+                    )
+
+            if len(hypos) > 0:
+                session.send_hypo_batch(hypos)
+                for sent_id, hypo in hypos.items():
+                    if hypo == DEFAULT_EOS:
+                        del list_of_states[sent_id]
+
     def finish_eval(self, states, new_state):
         if len(new_state) == 0 and len(states["indices"]["src"]) == 0:
             return True
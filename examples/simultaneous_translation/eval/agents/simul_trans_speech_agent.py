@@ -16,11 +16,37 @@ class SimulTransSpeechAgent(SimulTransAgent):
         self.frame_length = 25
         self.frame_shift = 10
         self.sample_rate = 16000
-    
+
+        self.streaming_features = args.streaming_features
+        if self.incremental_encoder and not self.streaming_features:
+            # Without streaming features, the whole prefix is normalized
+            # again at each read, so the frames which are already encoded
+            # change
+            raise ValueError(
+                "--incremental-encoder requires --streaming-features"
+            )
+
+    @staticmethod
+    def add_args(parser):
+        SimulTransAgent.add_args(parser)
+        parser.add_argument('--streaming-features', action='store_true',
+                            help='Only compute the filter bank features of the new samples '
+                                 'and normalize them with online mean and variance statistics, '
+                                 'instead of processing the whole utterance at every read')
+        return parser
+
     def init_states(self):
         states = super().init_states()
         states["frame_length"] = self.frame_shift
         states["finish_read"] = False
+        if self.streaming_features:
+            from examples.simultaneous_translation.data.streaming_features import StreamingFbank
+            states["feature_extractor"] = StreamingFbank(
+                num_mel_bins=self.num_mel_bins,
+                frame_length=self.frame_length,
+                frame_shift=self.frame_shift,
+                sample_rate=self.sample_rate,
+            )
         return states
 
     def build_word_splitter(self, args):
@@ -37,41 +63,52 @@ class SimulTransSpeechAgent(SimulTransAgent):
 
     def update_states(self, states, new_state):
 
-        # utterence is a list
+        # utterence is a list, or a numpy array with the binary protocol
         # len = sample_rate / 1000 * segment_size (ms)
         # When sample_rate = 16000h, segment_size = 10ms
         # len = 160
         utterence = new_state["segment"]
+        is_eos = isinstance(utterence, str) and utterence == self.eos
 
-        if utterence not in [self.eos]:
-            # TODO: make it incremantal
-            states['segments']['src'] += utterence
-
-            if (
-                len(states['segments']['src']) 
-                >= self.sample_rate / 1000 * self.frame_length
-            ):
-                import torch
-                import torchaudio.compliance.kaldi as kaldi
-                from examples.simultaneous_translation.data.data_utils import apply_mv_norm
-                torch.manual_seed(0)
-                output = kaldi.fbank(
-                    torch.FloatTensor(states["segments"]["src"]).unsqueeze(0),
-                    num_mel_bins=self.num_mel_bins,
-                    frame_length=self.frame_length,
-                    frame_shift=self.frame_shift
-                )
-
-                # TODO: apply_mv_norm function calculation mean and var along the time axis
-                # This caused a mismatch between the train and inference
-                states["indices"]['src'] = apply_mv_norm(output)
-
+        if not is_eos:
+            self.extract_features(states, utterence)
             states["steps"]["src"] += len(utterence) / self.sample_rate * 1000
         else:
             states["finish_read"] = True
 
         return states
 
+    def extract_features(self, states, samples):
+        """Update the features of the source, states["indices"]["src"], with new samples"""
+        if self.streaming_features:
+            # Only the frames of the new samples are computed
+            states["feature_extractor"](samples)
+            features = states["feature_extractor"].get_features()
+            if features.size(0) > 0:
+                states["indices"]["src"] = features
+            return
+
+        states['segments']['src'] += list(samples)
+
+        if (
+            len(states['segments']['src']) 
+            >= self.sample_rate / 1000 * self.frame_length
+        ):
+            import torch
+            import torchaudio.compliance.kaldi as kaldi
+            from examples.simultaneous_translation.data.data_utils import apply_mv_norm
+            torch.manual_seed(0)
+            output = kaldi.fbank(
+                torch.FloatTensor(states["segments"]["src"]).unsqueeze(0),
+                num_mel_bins=self.num_mel_bins,
+                frame_length=self.frame_length,
+                frame_shift=self.frame_shift
+            )
+
+            # TODO: apply_mv_norm function calculation mean and var along the time axis
+            # This caused a mismatch between the train and inference
+            states["indices"]['src'] = apply_mv_norm(output)
+
     def read_action(self, states):
         segment_size = self.model.decoder.attention.segment_size(
             self.frame_shift,
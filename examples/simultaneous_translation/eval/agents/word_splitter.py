@@ -1,3 +1,9 @@
+from functools import lru_cache
+
+# Number of source words whose split is cached
+DEFAULT_SPLIT_CACHE_SIZE = 2 ** 16
+
+
 class SubwordSplitter(object):
     def process_line(self, string):
         raise NotImplementedError
@@ -11,7 +17,7 @@ class NoneWordSplitter(object):
 
     def split(self, string):
         return [string]
-    
+
     def process_line(self, string):
         return [string]
 
@@ -24,55 +30,88 @@ class NoneWordSplitter(object):
     def last_full_word_step(self, tokens, step):
         return len(tokens)
 
+    def init_boundary_state(self):
+        return {}
+
+    def update_end_idx_last_full_word(self, tokens, boundary_state):
+        return len(tokens)
+
     def end_idx_last_full_word(self, tokens):
         return len(tokens)
 
 class BPEWordSplitter(object):
-    def __init__(self, model_path):
+    def __init__(self, model_path, cache_size=DEFAULT_SPLIT_CACHE_SIZE):
         super().__init__()
         from subword_nmt.apply_bpe import BPE
         with open(model_path) as f:
             self.model = BPE(f)
-    
+        # Tuples, so that the cached splits can't be modified by the callers
+        self._cached_split = lru_cache(maxsize=cache_size)(
+            lambda string: tuple(self.model.process_line(string).split())
+        )
+
     def split(self, string: str) -> list:
-        return self.model.process_line(string).split()
-    
+        return list(self._cached_split(string))
+
+    def init_boundary_state(self):
+        # Number of tokens already inspected, index of the last token
+        # (but the first one) which ends a word
+        return {"num_tokens": 0, "end_idx": 0}
+
+    def update_end_idx_last_full_word(self, tokens, boundary_state):
+        """
+        Same as end_idx_last_full_word, but only inspects the tokens
+        appended since the last call with the same boundary_state.
+        """
+        for i in range(max(boundary_state["num_tokens"], 1), len(tokens)):
+            if tokens[i][-2:] != '@@':
+                boundary_state["end_idx"] = i
+        boundary_state["num_tokens"] = len(tokens)
+        return boundary_state["end_idx"]
+
     def end_idx_last_full_word(self, tokens):
-        length = len(tokens)
-        # Begin of word indices
-        bow_indices = [0] + [i + 1 for i, t in enumerate(tokens[1:]) if t[-2:] != '@@'] 
-        #print(tokens)
-        #print(bow_indices)
-        #import pdb; pdb.set_trace()
-
-        if len(bow_indices) < 2:
-            return 0
-        else:
-            return bow_indices[-1]
-    
+        return self.update_end_idx_last_full_word(tokens, self.init_boundary_state())
+
     def merge(self, list_of_string):
         return " ".join([item.replace("@@", "") for item in list_of_string])
 
 class SentencePieceModelWordSplitter(object):
-    def __init__(self, model_path):
+    def __init__(self, model_path, cache_size=DEFAULT_SPLIT_CACHE_SIZE):
         super().__init__()
         import sentencepiece as spm
         self.model = spm.SentencePieceProcessor()
         self.model.Load(model_path)
-    
+        # Tuples, so that the cached splits can't be modified by the callers
+        self._cached_split = lru_cache(maxsize=cache_size)(
+            lambda string: tuple(self.model.EncodeAsPieces(string))
+        )
+
     def split(self, string: str) -> list:
-        return self.model.EncodeAsPieces(string)
-    
-    def end_idx_last_full_word(self, tokens):
-        length = len(tokens)
-        # Begin of word indices
-        bow_indices = [i for i, t in enumerate(tokens) if t[0] == '\u2581']
+        return list(self._cached_split(string))
+
+    def init_boundary_state(self):
+        # Number of tokens already inspected, number of begin of words and
+        # index of the last one
+        return {"num_tokens": 0, "num_bow": 0, "last_bow": 0}
 
-        if len(bow_indices) < 2:
+    def update_end_idx_last_full_word(self, tokens, boundary_state):
+        """
+        Same as end_idx_last_full_word, but only inspects the tokens
+        appended since the last call with the same boundary_state.
+        """
+        for i in range(boundary_state["num_tokens"], len(tokens)):
+            if tokens[i][0] == '▁':
+                boundary_state["num_bow"] += 1
+                boundary_state["last_bow"] = i
+        boundary_state["num_tokens"] = len(tokens)
+
+        if boundary_state["num_bow"] < 2:
             return 0
         else:
-            return bow_indices[-1]
-    
+            return boundary_state["last_bow"]
+
+    def end_idx_last_full_word(self, tokens):
+        return self.update_end_idx_last_full_word(tokens, self.init_boundary_state())
+
     def merge(self, list_of_string):
         return self.model.DecodePieces(list_of_string)
-
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import threading
+
+
+class AsyncSimulSTEvaluationService(object):
+    """
+    Client with the same interface as SimulSTEvaluationService, whose
+    requests are sent by an asyncio event loop running in a background
+    thread, over a pool of persistent (keep-alive) HTTP connections.
+
+    get_src blocks until the source segment is received, while send_hypo
+    returns immediately. Requests of the same sentence are always processed
+    by the server in the order they were made, so the delays are the same
+    as with the synchronous client. At most max_connections requests are
+    in flight at the same time.
+    """
+    DEFAULT_HOSTNAME = 'localhost'
+    DEFAULT_PORT = 12321
+    DEFAULT_MAX_CONNECTIONS = 8
+
+    def __init__(
+        self, hostname=DEFAULT_HOSTNAME, port=DEFAULT_PORT,
+        max_connections=DEFAULT_MAX_CONNECTIONS, binary=False
+    ):
+        try:
+            import aiohttp  # noqa
+        except ImportError:
+            raise ImportError(
+                "Please install aiohttp to use the asynchronous client: "
+                "pip install aiohttp"
+            )
+        self.hostname = hostname
+        self.port = port
+        self.base_url = f'http://{self.hostname}:{self.port}'
+        self.max_connections = max_connections
+        # Receive the source segments as raw bytes instead of json
+        self.binary = binary
+
+        # Last request of each sentence, to keep the order of the requests
+        self.last_requests = {}
+        self.pending_requests = set()
+        self.lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self._run(self._start())
+
+    async def _start(self):
+        import aiohttp
+        self.semaphore = asyncio.Semaphore(self.max_connections)
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections)
+        )
+
+    async def _close(self):
+        await self.http_session.close()
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.wait()
+        self._run(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self.new_session()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _request(self, path, params, previous_requests):
+        for request in previous_requests:
+            try:
+                await asyncio.wrap_future(request)
+            except Exception:
+                # Already reported by the previous request
+                pass
+
+        async with self.semaphore:
+            async with self.http_session.get(
+                f'{self.base_url}/{path}', params=params
+            ) as response:
+                response.raise_for_status()
+                return await response.read()
+
+    def _submit(self, path, params=None, sent_ids=()):
+        with self.lock:
+            previous_requests = [
+                self.last_requests[sent_id]
+                for sent_id in set(sent_ids)
+                if sent_id in self.last_requests
+            ]
+            request = asyncio.run_coroutine_threadsafe(
+                self._request(path, params or {}, previous_requests),
+                self.loop
+            )
+            for sent_id in sent_ids:
+                self.last_requests[sent_id] = request
+            self.pending_requests.add(request)
+
+        def done(request):
+            with self.lock:
+                self.pending_requests.discard(request)
+                for sent_id in sent_ids:
+                    if self.last_requests.get(sent_id, None) is request:
+                        del self.last_requests[sent_id]
+
+        request.add_done_callback(done)
+        return request
+
+    def wait(self):
+        """Wait until all the pending requests are processed."""
+        with self.lock:
+            pending_requests = list(self.pending_requests)
+        for request in pending_requests:
+            try:
+                request.result()
+            except Exception:
+                pass
+
+    def new_session(self):
+        self.wait()
+        try:
+            self._submit('start').result()
+        except Exception as e:
+            print(f'Failed to start an evaluation session: {e}')
+
+        print('Evaluation session started.')
+        return self
+
+    def get_scores(self):
+        # end eval session
+        self.wait()
+        try:
+            scores = self._submit('end').result()
+            print('Scores: {}'.format(scores.decode('utf-8')))
+            print('Evaluation session finished.')
+        except Exception as e:
+            print(f'Failed to end an evaluation session: {e}')
+
+    def get_src(self, sent_id=None, value=None) -> str:
+        info = {
+            "sent_id": sent_id,
+            "value": value
+        }
+        if sent_id is None:
+            out = self._get('get', info, [])
+            return json.loads(out.decode('utf-8'))
+        return self._get_segments(info, [sent_id])[0]
+
+    def get_src_batch(self, values: dict) -> list:
+        # values: {sent_id: value}
+        info = [
+            {"sent_id": sent_id, "value": value}
+            for sent_id, value in values.items()
+        ]
+        return self._get_segments(info, list(values))
+
+    def _get(self, path, info, sent_ids):
+        try:
+            return self._submit(path, {'info': json.dumps(info)}, sent_ids).result()
+        except Exception as e:
+            print(f'Failed to request a source segment: {e}')
+            raise
+
+    def _get_segments(self, info, sent_ids):
+        if self.binary:
+            from binary_protocol import unpack_segments
+            return unpack_segments(self._get('get_binary', info, sent_ids))
+
+        list_of_segments = json.loads(self._get('get', info, sent_ids).decode('utf-8'))
+        if isinstance(info, dict):
+            return [list_of_segments]
+        return list_of_segments
+
+    def send_hypo(self, sent_id: int, hypo: str) -> None:
+        self.send_hypo_batch({sent_id: hypo})
+
+    def send_hypo_batch(self, hypos: dict) -> None:
+        # hypos: {sent_id: hypo}
+        request = self._submit('send', {'hypo': json.dumps(hypos)}, list(hypos))
+
+        def report(request):
+            if request.exception() is not None:
+                print(f'Failed to send a translated segment: {request.exception()}')
+
+        request.add_done_callback(report)
@@ -0,0 +1,290 @@
+"""
+Benchmark of the computation of an agent, without the server.
+
+The source stream that the server sends for a test set is recorded once in
+a single file (the words of each sentence, or the audio samples with the
+segment size of the server), and then replayed in the same process into
+any registered agent, which reports the time spent in each step of the
+agent:
+
+    python benchmark.py record \
+        --scorer-type speech --tgt-file $tgt --output $recording
+    python benchmark.py replay \
+        --recording $recording --agent-type simul_trans_speech ...
+
+The recording is stored as packed arrays (see data/indexed_arrays.py),
+keyed by sentence id.
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+from examples.simultaneous_translation.data.indexed_arrays import (
+    IndexedArrays,
+    IndexedArraysWriter,
+)
+
+DEFAULT_EOS = '</s>'
+
+# Methods of the agent, of its model and of its word splitters which are
+# timed (when the agent has them). The timings are nested: update_states
+# includes extract_features, the feature extraction of the speech agents,
+# and the source word splitting of the text agents, and policy includes the
+# decisions and predictions.
+AGENT_STEPS = ["update_states", "extract_features", "policy"]
+MODEL_STEPS = [
+    "decision_from_states",
+    "predict_from_states",
+    "predict_from_states_batch",
+]
+WORD_SPLITTER_STEPS = [
+    "split",
+    "end_idx_last_full_word",
+    "update_end_idx_last_full_word",
+    "merge",
+]
+
+
+def record(scorer, scorer_type, prefix_path):
+    """
+    Record the source segments that the scorer sends for each sentence,
+    with the segment size of the server.
+    """
+    metadata = {"scorer_type": scorer_type}
+    if scorer_type == "speech":
+        metadata.update(
+            {
+                "sample_rate": scorer.sample_rate,
+                "segment_size": scorer.segment_size,
+                "lengths": scorer.src_lengths(),
+            }
+        )
+        dtype = scorer.wav_data_type
+    else:
+        dtype = np.uint8
+
+    segments = defaultdict(list)
+    for sent_id in range(len(scorer)):
+        while True:
+            segment = scorer.send_src(sent_id, {})["segment"]
+            if isinstance(segment, str) and segment == DEFAULT_EOS:
+                break
+            segments[sent_id].append(segment)
+
+    writer = IndexedArraysWriter(prefix_path, dtype, metadata=metadata)
+    for sent_id in range(len(scorer)):
+        if scorer_type == "speech":
+            array = np.concatenate(
+                [np.asarray(s, dtype=dtype) for s in segments[sent_id]]
+                or [np.zeros(0, dtype=dtype)]
+            )
+        else:
+            array = np.frombuffer(
+                "\n".join(segments[sent_id]).encode("utf-8"), dtype=np.uint8
+            )
+        writer.add_item(str(sent_id), array)
+    writer.finalize()
+
+
+class ReplaySession(object):
+    """
+    Session with the same interface as SimulSTEvaluationService, which
+    sends the segments of a recording the same way as the server. The
+    hypotheses are kept, but not scored.
+    """
+
+    def __init__(self, prefix_path):
+        self.recording = IndexedArrays(prefix_path)
+        self.scorer_type = self.recording.metadata["scorer_type"]
+        self.num_sentences = len(self.recording)
+        if self.scorer_type == "speech":
+            self.segment_size = self.recording.metadata["segment_size"]
+            self.block_size = (
+                self.recording.metadata["sample_rate"] // 1000 * self.segment_size
+            )
+            self.lengths = self.recording.metadata["lengths"]
+            self.sources = [self.recording[i] for i in range(self.num_sentences)]
+        else:
+            self.sources = [
+                bytes(self.recording[i]).decode("utf-8").split("\n")
+                if self.recording.sizes[i] > 0 else []
+                for i in range(self.num_sentences)
+            ]
+        self.new_session()
+
+    def new_session(self):
+        self.steps = defaultdict(int)
+        self.hypos = defaultdict(list)
+        return self
+
+    def get_scores(self):
+        return {}
+
+    def get_src(self, sent_id=None, value=None):
+        if sent_id is None:
+            return {"num_sentences": self.num_sentences}
+        sent_id = int(sent_id)
+        if self.scorer_type == "speech":
+            return self._get_speech_segment(sent_id, value or {})
+        return self._get_text_segment(sent_id)
+
+    def get_src_batch(self, values: dict) -> list:
+        return [self.get_src(sent_id, value) for sent_id, value in values.items()]
+
+    def send_hypo(self, sent_id: int, hypo: str) -> None:
+        self.hypos[int(sent_id)].append(hypo)
+
+    def send_hypo_batch(self, hypos: dict) -> None:
+        for sent_id, hypo in hypos.items():
+            self.send_hypo(sent_id, hypo)
+
+    def _get_text_segment(self, sent_id):
+        words = self.sources[sent_id]
+        step = self.steps[sent_id]
+        if step >= len(words):
+            segment = DEFAULT_EOS
+        else:
+            segment = words[step]
+            self.steps[sent_id] += 1
+        return {"sent_id": sent_id, "segment_id": step, "segment": segment}
+
+    def _get_speech_segment(self, sent_id, value):
+        step = self.steps[sent_id]
+        if step >= self.lengths[sent_id]:
+            segment = DEFAULT_EOS
+        else:
+            num_segments = (
+                value.get("segment_size", None) or self.segment_size
+            ) // self.segment_size
+            start_idx = step // self.segment_size
+            segment = self.sources[sent_id][
+                start_idx * self.block_size: (start_idx + num_segments) * self.block_size
+            ]
+            self.steps[sent_id] = min(
+                self.lengths[sent_id], step + self.segment_size * num_segments
+            )
+        return {"sent_id": sent_id, "segment_id": step, "segment": segment}
+
+
+class StepTimer(object):
+    """Wrap methods of objects to accumulate their number of calls and time"""
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def wrap(self, obj, method, name):
+        func = getattr(obj, method, None)
+        if func is None:
+            return
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[name] += time.perf_counter() - start
+                self.counts[name] += 1
+
+        setattr(obj, method, timed)
+
+    def wrap_agent(self, agent):
+        for method in AGENT_STEPS:
+            self.wrap(agent, method, method)
+        for method in MODEL_STEPS:
+            self.wrap(agent.model, method, method)
+        for key, word_splitter in getattr(agent, "word_splitter", {}).items():
+            for method in WORD_SPLITTER_STEPS:
+                self.wrap(word_splitter, method, f"word_splitter.{key}.{method}")
+
+    def report(self):
+        return {
+            name: {
+                "calls": self.counts[name],
+                "total_s": self.times[name],
+                "mean_ms": 1000 * self.times[name] / max(self.counts[name], 1),
+            }
+            for name in self.times
+        }
+
+
+def replay(agent, session, low, high, num_threads=1):
+    timer = StepTimer()
+    timer.wrap_agent(agent)
+    start = time.perf_counter()
+    agent.decode(session, low, high, num_threads)
+    total_s = time.perf_counter() - start
+
+    return {
+        "num_sentences": len(session.hypos),
+        "num_words": sum(len(hypos) - 1 for hypos in session.hypos.values()),
+        "total_s": total_s,
+        "steps": timer.report(),
+    }
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Record the source stream of a test set, or replay it "
+        "into an agent and time the steps of the agent"
+    )
+    parser.add_argument('mode', choices=["record", "replay"])
+    parser.add_argument('--recording', type=str,
+                        help='Prefix of the recording (replay)')
+    parser.add_argument('--agent-type', default=None,
+                        help='Agent type (replay)')
+    parser.add_argument('--start-idx', type=int, default=0,
+                        help='Start index of the sentences to replay')
+    parser.add_argument('--end-idx', type=int, default=10000,
+                        help='End index of the sentences to replay')
+    parser.add_argument('--num-threads', type=int, default=1,
+                        help='Number of threads used by the agent. The step '
+                        'timings are only exact with a single thread')
+    parser.add_argument('--report', type=str, default=None,
+                        help='Write the timings to this json file')
+
+    args, _ = parser.parse_known_args()
+    if args.mode == "record":
+        from scorers import add_scorer_args
+        add_scorer_args(parser)
+    else:
+        from agents.registry import REGISTRIES
+        for registry_name, REGISTRY in REGISTRIES.items():
+            choice = getattr(args, registry_name, None)
+            if choice is not None:
+                cls = REGISTRY['registry'][choice]
+                if hasattr(cls, 'add_args'):
+                    cls.add_args(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    if args.mode == "record":
+        from scorers import build_scorer
+        # --output is the prefix of the recording
+        record(build_scorer(args), args.scorer_type, args.output)
+        sys.exit(0)
+
+    from agents import build_agent
+    agent = build_agent(args)
+    session = ReplaySession(args.recording)
+    report = replay(agent, session, args.start_idx, args.end_idx, args.num_threads)
+
+    print(
+        f"{report['num_sentences']} sentences, {report['num_words']} words "
+        f"in {report['total_s']:.3f}s"
+    )
+    print(f"{'step':<40}{'calls':>10}{'total (s)':>12}{'mean (ms)':>12}")
+    for name, step in sorted(report["steps"].items()):
+        print(
+            f"{name:<40}{step['calls']:>10}"
+            f"{step['total_s']:>12.3f}{step['mean_ms']:>12.3f}"
+        )
+
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,74 @@
+"""
+Binary encoding of the source segments sent by the server.
+
+A response is a concatenation of records, one per segment. Each record is a
+16 bytes header (sent_id, segment_id, payload size in bytes, type) followed
+by the payload. The type is either the numpy dtype string of the samples
+(e.g. "<i2" for little-endian int16), in which case the payload is the raw
+samples, or "utf8" for text segments and the end of sentence token.
+"""
+import struct
+
+import numpy as np
+
+HEADER = struct.Struct('<iiI4s')
+TEXT_TYPE = b'utf8'
+CONTENT_TYPE = 'application/octet-stream'
+
+
+def pack_segment(segment_dict) -> bytes:
+    segment = segment_dict["segment"]
+    if isinstance(segment, str):
+        segment_type = TEXT_TYPE
+        payload = segment.encode('utf-8')
+    else:
+        segment = np.asarray(segment)
+        segment_type = segment.dtype.str.encode('ascii')
+        payload = segment.tobytes()
+
+    header = HEADER.pack(
+        int(segment_dict["sent_id"]),
+        int(segment_dict["segment_id"]),
+        len(payload),
+        segment_type
+    )
+    return header + payload
+
+
+def split_records(data: bytes) -> list:
+    """Split a response into the records of each segment, without decoding them."""
+    records = []
+    offset = 0
+    while offset < len(data):
+        size = HEADER.unpack_from(data, offset)[2]
+        records.append(data[offset: offset + HEADER.size + size])
+        offset += HEADER.size + size
+    return records
+
+
+def unpack_segments(data: bytes) -> list:
+    """
+    Decode the records of a response. The samples are numpy arrays
+    sharing the memory of data.
+    """
+    list_of_segments = []
+    offset = 0
+    while offset < len(data):
+        sent_id, segment_id, size, segment_type = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        if segment_type == TEXT_TYPE:
+            segment = bytes(data[offset: offset + size]).decode('utf-8')
+        else:
+            dtype = np.dtype(segment_type.rstrip(b'\x00').decode('ascii'))
+            segment = np.frombuffer(
+                data, dtype=dtype, count=size // dtype.itemsize, offset=offset
+            )
+        offset += size
+        list_of_segments.append(
+            {
+                "sent_id": sent_id,
+                "segment_id": segment_id,
+                "segment": segment
+            }
+        )
+    return list_of_segments
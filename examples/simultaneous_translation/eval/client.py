@@ -6,10 +6,12 @@ class SimulSTEvaluationService(object):
     DEFAULT_HOSTNAME = 'localhost'
     DEFAULT_PORT = 12321
 
-    def __init__(self, hostname=DEFAULT_HOSTNAME, port=DEFAULT_PORT):
+    def __init__(self, hostname=DEFAULT_HOSTNAME, port=DEFAULT_PORT, binary=False):
         self.hostname = hostname
         self.port = port
         self.base_url = f'http://{self.hostname}:{self.port}'
+        # Receive the source segments as raw bytes instead of json
+        self.binary = binary
 
     def __enter__(self):
         # start eval session
@@ -51,6 +53,9 @@ class SimulSTEvaluationService(object):
             "sent_id": sent_id,
             "value": value
         }
+        if self.binary and sent_id is not None:
+            return self._get_src_binary(info)[0]
+
         url = f'{self.base_url}/get?info={urllib.parse.quote(json.dumps(info))}'
         try:
             out = urllib.request.urlopen(url)
@@ -58,8 +63,37 @@ class SimulSTEvaluationService(object):
             print(f'Failed to request a source segment: {e}')
         return json.loads(out.read().decode('utf-8'))
 
+    def _get_src_binary(self, info) -> list:
+        from binary_protocol import unpack_segments
+        url = f'{self.base_url}/get_binary?info={urllib.parse.quote(json.dumps(info))}'
+        try:
+            out = urllib.request.urlopen(url)
+        except Exception as e:
+            print(f'Failed to request a source segment: {e}')
+        return unpack_segments(out.read())
+
+    def get_src_batch(self, values: dict) -> list:
+        # values: {sent_id: value}
+        info = [
+            {"sent_id": sent_id, "value": value}
+            for sent_id, value in values.items()
+        ]
+        if self.binary:
+            return self._get_src_binary(info)
+
+        url = f'{self.base_url}/get?info={urllib.parse.quote(json.dumps(info))}'
+        try:
+            out = urllib.request.urlopen(url)
+        except Exception as e:
+            print(f'Failed to request source segments: {e}')
+        return json.loads(out.read().decode('utf-8'))
+
     def send_hypo(self, sent_id: int, hypo: str) -> None:
-        url = f'{self.base_url}/send?hypo={urllib.parse.quote(json.dumps({sent_id: hypo}))}'
+        self.send_hypo_batch({sent_id: hypo})
+
+    def send_hypo_batch(self, hypos: dict) -> None:
+        # hypos: {sent_id: hypo}
+        url = f'{self.base_url}/send?hypo={urllib.parse.quote(json.dumps(hypos))}'
         try:
             out = urllib.request.urlopen(url)
         except Exception as e:
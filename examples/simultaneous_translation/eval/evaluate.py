@@ -27,8 +27,21 @@ def get_args():
                         help='Reset the server')
     parser.add_argument('--num-threads', type=int, default=10,
                         help='Number of threads used by agent')
+    parser.add_argument('--async-client', action="store_true",
+                        help='Use the asyncio client with persistent connections')
+    parser.add_argument('--max-connections', type=int, default=8,
+                        help='Maximum number of concurrent requests of the asyncio client')
+    parser.add_argument('--binary', action="store_true",
+                        help='Receive the source segments as raw bytes instead of json')
+    parser.add_argument('--local', action="store_true",
+                        help='Evaluate with a scorer in the same process instead '
+                        'of a server, which takes the arguments of the server '
+                        '(--scorer-type, --src-file, --tgt-file ...)')
 
     args, _ = parser.parse_known_args()
+    if args.local:
+        from scorers import add_scorer_args
+        add_scorer_args(parser)
     for registry_name, REGISTRY in REGISTRIES.items():
         choice = getattr(args, registry_name, None)
         if choice is not None:
@@ -41,7 +54,17 @@ def get_args():
 
 if __name__ == "__main__":
     args = get_args()
-    session = SimulSTEvaluationService(args.hostname, args.port)
+    if args.local:
+        from scorers import build_scorer
+        from local_client import LocalSimulSTEvaluationService
+        session = LocalSimulSTEvaluationService(build_scorer(args))
+    elif args.async_client:
+        from async_client import AsyncSimulSTEvaluationService
+        session = AsyncSimulSTEvaluationService(
+            args.hostname, args.port, args.max_connections, args.binary
+        )
+    else:
+        session = SimulSTEvaluationService(args.hostname, args.port, args.binary)
 
     if args.reset_server:
         session.new_session()
@@ -50,5 +73,9 @@ if __name__ == "__main__":
         agent = build_agent(args)
         agent.decode(session, args.start_idx, args.end_idx, args.num_threads)
 
-    if args.scores:
+    # The scores of a local session are lost at the end of the process
+    if args.scores or args.local:
         session.get_scores()
+
+    if args.async_client:
+        session.close()
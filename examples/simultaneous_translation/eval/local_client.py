@@ -0,0 +1,60 @@
+import json
+import threading
+
+
+class LocalSimulSTEvaluationService(object):
+    """
+    Client with the same interface as SimulSTEvaluationService, which calls
+    a scorer in the same process instead of sending requests to the server.
+    The calls are serialized, as the requests by the server, so the delays
+    and scores are the same as with the server.
+    """
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self.new_session()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def new_session(self):
+        with self.lock:
+            self.scorer.reset()
+        print('Evaluation session started.')
+        return self
+
+    def get_scores(self):
+        with self.lock:
+            scores = self.scorer.score()
+        print('Scores: {}'.format(json.dumps(scores)))
+        print('Evaluation session finished.')
+        return scores
+
+    def get_progress(self):
+        with self.lock:
+            return self.scorer.progress()
+
+    def get_src(self, sent_id=None, value=None):
+        with self.lock:
+            if sent_id is None:
+                return self.scorer.get_info()
+            return self.scorer.send_src(int(sent_id), value)
+
+    def get_src_batch(self, values: dict) -> list:
+        # values: {sent_id: value}
+        with self.lock:
+            return [
+                self.scorer.send_src(int(sent_id), value)
+                for sent_id, value in values.items()
+            ]
+
+    def send_hypo(self, sent_id: int, hypo: str) -> None:
+        self.send_hypo_batch({sent_id: hypo})
+
+    def send_hypo_batch(self, hypos: dict) -> None:
+        # hypos: {sent_id: hypo}
+        with self.lock:
+            self.scorer.recv_hyp(hypos)
@@ -1,11 +1,42 @@
 import sys
 from utils import registry
+from .scorer import QUALITY_METRICS
 (
     build_scorer, 
     register_scorer, 
     simul_scorer
 ) = registry.setup_registry('--scorer-type')
 
+
+def add_scorer_args(parser):
+    """Add the arguments of the scorer, including the ones of --scorer-type"""
+    parser.add_argument('--src-file', type=str,
+                        help='Source file')
+    parser.add_argument('--tgt-file', type=str,
+                        help='Target file')
+    parser.add_argument('--output', type=str,
+                        help='')
+    parser.add_argument('--scorer-type', type=str, default="text", choices=["text", "speech"],
+                        help='Type of data to evaluate')
+    parser.add_argument('--tokenizer', default="13a", choices=["none", "13a"],
+                        help='Type of data to evaluate')
+    parser.add_argument('--metrics', nargs='*', default=list(QUALITY_METRICS.keys()),
+                        choices=list(QUALITY_METRICS.keys()),
+                        help='Quality metrics computed at the end of the session, '
+                        'in addition to the latency. Each metric is imported only '
+                        'if it is selected')
+    parser.add_argument('--metric-workers', type=int, default=0,
+                        help='Number of processes computing the quality metrics '
+                        '(default: one per metric)')
+    args, _ = parser.parse_known_args()
+    for registry_name, REGISTRY in registry.REGISTRIES.items():
+        choice = getattr(args, registry_name, None)
+        if choice is not None:
+            cls = REGISTRY['registry'][choice]
+            if hasattr(cls, 'add_args'):
+                cls.add_args(parser)
+
+
 import importlib
 import os
 for file in os.listdir(os.path.dirname(__file__)):
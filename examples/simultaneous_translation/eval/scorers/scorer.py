@@ -1,14 +1,71 @@
-from vizseq.scorers.bleu import BLEUScorer
-from vizseq.scorers.ter import TERScorer
-from vizseq.scorers.meteor import METEORScorer
 from examples.simultaneous_translation.utils.eval_latency import LatencyScorer
-from collections import defaultdict
+from examples.simultaneous_translation.data.manifest import SpeechManifest, find_manifest
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import asyncio
+import importlib
 import json
+import sys
+import time
+import sacrebleu
 
 DEFAULT_EOS = '</s>'
+BLEU_ORDER = 4
+LATENCY_METRICS = {
+    'DAL': 'differentiable_average_lagging',
+    'AL': 'average_lagging',
+    'AP': 'average_proportion',
+}
+# Corpus-level quality metrics: module and class of their vizseq scorer,
+# which is imported only when the metric is computed
+QUALITY_METRICS = OrderedDict([
+    ('BLEU', ('vizseq.scorers.bleu', 'BLEUScorer')),
+    ('TER', ('vizseq.scorers.ter', 'TERScorer')),
+    ('METEOR', ('vizseq.scorers.meteor', 'METEORScorer')),
+])
+
+
+def quality_score(metric, translations, references, tokenizer):
+    """Corpus-level score of a quality metric, in a worker process."""
+    module_name, class_name = QUALITY_METRICS[metric]
+    scorer_cls = getattr(importlib.import_module(module_name), class_name)
+    extra_args = {'bleu_tokenizer': tokenizer} if metric == 'BLEU' else None
+    return scorer_cls(
+        sent_level=False, corpus_level=True, extra_args=extra_args
+    ).score(translations, [references])[0]
+
+
+def bleu_statistics(hypothesis, reference, tokenizer):
+    """BLEU sufficient statistics of one sentence."""
+    bleu = sacrebleu.corpus_bleu([hypothesis], [[reference]], tokenize=tokenizer)
+    return {
+        "correct": list(bleu.counts),
+        "total": list(bleu.totals),
+        "sys_len": bleu.sys_len,
+        "ref_len": bleu.ref_len,
+    }
+
+
+def bleu_from_statistics(stats):
+    if hasattr(sacrebleu, "compute_bleu"):
+        compute_bleu = sacrebleu.compute_bleu
+    else:
+        compute_bleu = sacrebleu.BLEU.compute_bleu
+    return compute_bleu(
+        stats["correct"], stats["total"], stats["sys_len"], stats["ref_len"],
+        smooth_method='exp'
+    ).score
+
+
 class SimulScorer(object):
+    # Whether the delays are in ms, so that the computation time can be
+    # added to them for the computation-aware latency
+    computation_aware = False
+
     def __init__(self, args):
         self.tokenizer = args.tokenizer
+        self.metrics = getattr(args, "metrics", list(QUALITY_METRICS.keys()))
+        self.metric_workers = getattr(args, "metric_workers", 0)
         if args.output is not None:
             self.output_files = {
                 "text": args.output + ".text",
@@ -27,43 +84,222 @@ class SimulScorer(object):
     def send_src(self, sent_id, *args):
         raise NotImplementedError
 
+    def record_event(self, sent_id):
+        """
+        Called on each request of a sentence. The time since the previous
+        request of the sentence is the time the agent spent computing (ms).
+        """
+        now = time.monotonic()
+        if sent_id in self.event_times:
+            self.compute_times[sent_id] += 1000 * (now - self.event_times[sent_id])
+        self.event_times[sent_id] = now
+
     def recv_hyp(self, hypo):
         for sent_id, trans in hypo.items():
+            self.record_event(int(sent_id))
             self.translations[
                 int(sent_id)
             ].append(
                 (
                     trans, 
-                    self.steps[int(sent_id)]
+                    self.steps[int(sent_id)],
+                    # Elapsed time: source consumed + computation time
+                    self.steps[int(sent_id)] + self.compute_times[int(sent_id)]
                 )
             )
+            if trans == self.eos:
+                self.update_progress(int(sent_id))
 
     def reset(self):
         self.steps = defaultdict(int)
         self.translations = defaultdict(list)
+        # Monotonic time of the last request and total computation time
+        # (ms) of each sentence
+        self.event_times = {}
+        self.compute_times = defaultdict(float)
+        # Running statistics of the finished sentences
+        self.progress_stats = {
+            "num_sentences": 0,
+            "bleu": {
+                "correct": [0] * BLEU_ORDER,
+                "total": [0] * BLEU_ORDER,
+                "sys_len": 0,
+                "ref_len": 0,
+            },
+            "latency": {metric: 0.0 for metric in LATENCY_METRICS.values()},
+        }
+
+    def update_progress(self, sent_id):
+        """Add the scores of a sentence which received its end of sentence."""
+        translation = " ".join(t[0] for t in self.translations[sent_id][:-1])
+        bleu_stats = bleu_statistics(
+            translation, self.data["tgt"][sent_id], self.tokenizer
+        )
+        for key in ["correct", "total"]:
+            for n in range(BLEU_ORDER):
+                self.progress_stats["bleu"][key][n] += bleu_stats[key][n]
+        for key in ["sys_len", "ref_len"]:
+            self.progress_stats["bleu"][key] += bleu_stats[key]
+
+        latency_score = LatencyScorer().score(
+            [
+                {
+                    "src_len": self.src_length(sent_id),
+                    "delays": [t[1] for t in self.translations[sent_id]]
+                }
+            ],
+            start_from_zero=False
+        )
+        for metric in LATENCY_METRICS.values():
+            self.progress_stats["latency"][metric] += latency_score[metric]
+
+        self.progress_stats["num_sentences"] += 1
+
+    def progress(self):
+        """
+        BLEU and latency of the sentences finished so far. TER and METEOR
+        are only computed on the whole corpus by score.
+        """
+        num_sentences = self.progress_stats["num_sentences"]
+        scores = {
+            'num_sentences': num_sentences,
+            'num_total_sentences': len(self),
+        }
+        if num_sentences == 0:
+            return scores
+
+        scores['BLEU'] = bleu_from_statistics(self.progress_stats["bleu"])
+        for name, metric in LATENCY_METRICS.items():
+            scores[name] = self.progress_stats["latency"][metric] / num_sentences
+        return scores
     
+    def shard_range(self, shard_id, num_shards):
+        """Range of sentences [start, end) of a shard"""
+        return (
+            len(self) * shard_id // num_shards,
+            len(self) * (shard_id + 1) // num_shards
+        )
+
+    def shard_id(self, sent_id, num_shards):
+        shard_id = min(sent_id * num_shards // max(len(self), 1), num_shards - 1)
+        # Adjust the rounding of the integer division
+        while sent_id < self.shard_range(shard_id, num_shards)[0]:
+            shard_id -= 1
+        while sent_id >= self.shard_range(shard_id, num_shards)[1]:
+            shard_id += 1
+        return shard_id
+
+    def get_results(self, translations=True):
+        """
+        Translations and running statistics of the session, which can be
+        merged with the ones of other shards by merge_results.
+        """
+        return {
+            "translations": self.translations if translations else {},
+            "progress_stats": self.progress_stats,
+        }
+
+    def merge_results(self, list_of_results):
+        """
+        Replace the state of the session with the results of the shards,
+        so that progress and score are computed on all the shards.
+        """
+        self.reset()
+        for results in list_of_results:
+            for sent_id, translations in results["translations"].items():
+                self.translations[int(sent_id)] = [tuple(t) for t in translations]
+
+            stats = results["progress_stats"]
+            self.progress_stats["num_sentences"] += stats["num_sentences"]
+            for key in ["correct", "total"]:
+                for n in range(BLEU_ORDER):
+                    self.progress_stats["bleu"][key][n] += stats["bleu"][key][n]
+            for key in ["sys_len", "ref_len"]:
+                self.progress_stats["bleu"][key] += stats["bleu"][key]
+            for metric in LATENCY_METRICS.values():
+                self.progress_stats["latency"][metric] += stats["latency"][metric]
+
     def src_lengths(self):
         raise NotImplementedError
 
-    def score(self):
+    def src_length(self, sent_id):
+        return self.src_lengths()[sent_id]
+
+    def hypotheses(self):
+        """Translations, delays and elapsed times of all the sentences"""
         translations = []
         delays = []
+        elapsed = []
         for i in range(1 + max(self.translations.keys())):
             translations += [" ".join(t[0] for t in self.translations[i][:-1])]
             delays += [[t[1] for t in self.translations[i]]]
+            elapsed += [[t[2] for t in self.translations[i]]]
+        return translations, delays, elapsed
 
-        bleu_score = BLEUScorer(
-            sent_level=False, corpus_level=True,
-            extra_args={'bleu_tokenizer': self.tokenizer}
-        ).score(translations, [self.data["tgt"]])
-
-        ter_score = TERScorer(sent_level=False, corpus_level=True).score(
-            translations, [self.data["tgt"]]
-        )
-        meteor_score = METEORScorer(sent_level=False, corpus_level=True).score(
-            translations, [self.data["tgt"]]
+    def metric_executor(self):
+        """Process pool computing the quality metrics, one per metric by default"""
+        return ProcessPoolExecutor(
+            max_workers=self.metric_workers or max(len(self.metrics), 1)
         )
 
+    def submit_quality_scores(self, executor, translations):
+        """Submit the quality metrics, returns a dict future -> metric"""
+        return {
+            executor.submit(
+                quality_score, metric, translations, self.data["tgt"], self.tokenizer
+            ): metric
+            for metric in self.metrics
+        }
+
+    def record_quality_score(self, quality_scores, metric, value):
+        quality_scores[metric] = value
+        sys.stdout.write(f"{metric}: {value}\n")
+        sys.stdout.flush()
+
+    def score(self):
+        """
+        Scores of the session. The quality metrics (--metrics) are computed
+        in parallel in worker processes, and printed as they complete.
+        """
+        translations, delays, elapsed = self.hypotheses()
+        quality_scores = {}
+        if len(self.metrics) > 0:
+            with self.metric_executor() as executor:
+                futures = self.submit_quality_scores(executor, translations)
+                for future in as_completed(futures):
+                    self.record_quality_score(
+                        quality_scores, futures[future], future.result()
+                    )
+        return self.finalize_scores(translations, delays, elapsed, quality_scores)
+
+    async def score_async(self):
+        """
+        Same as score, but the event loop of the server keeps serving the
+        requests while the quality metrics are computed.
+        """
+        translations, delays, elapsed = self.hypotheses()
+        quality_scores = {}
+        if len(self.metrics) > 0:
+            with self.metric_executor() as executor:
+                futures = {
+                    asyncio.wrap_future(future): metric
+                    for future, metric in self.submit_quality_scores(
+                        executor, translations
+                    ).items()
+                }
+                pending = set(futures.keys())
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        self.record_quality_score(
+                            quality_scores, futures[future], future.result()
+                        )
+        return self.finalize_scores(translations, delays, elapsed, quality_scores)
+
+    def finalize_scores(self, translations, delays, elapsed, quality_scores):
+        """Add the latency to the quality scores, and write the results"""
         latency_score = LatencyScorer().score(
             [
                 {"src_len" : src_len, "delays" : delay} 
@@ -72,21 +308,34 @@ class SimulScorer(object):
             start_from_zero=False
         )
 
-        scores = {
-            'BLEU': bleu_score[0], 
-            'TER': ter_score[0], 
-            'METEOR': meteor_score[0],
-            'DAL' : latency_score['differentiable_average_lagging'],
-            'AL' : latency_score['average_lagging'],
-            'AP' : latency_score['average_proportion'],
-        }
+        scores = OrderedDict(
+            (metric, quality_scores[metric])
+            for metric in QUALITY_METRICS if metric in quality_scores
+        )
+        scores['DAL'] = latency_score['differentiable_average_lagging']
+        scores['AL'] = latency_score['average_lagging']
+        scores['AP'] = latency_score['average_proportion']
+
+        if self.computation_aware:
+            latency_ca_score = LatencyScorer().score(
+                [
+                    {"src_len" : src_len, "elapsed" : e}
+                    for src_len, e in zip(self.src_lengths(), elapsed)
+                ],
+                start_from_zero=False,
+                computation_aware=True
+            )
+            for name, metric in LATENCY_METRICS.items():
+                scores[name + '_CA'] = latency_ca_score[metric]
+        else:
+            elapsed = None
 
         if self.output_files is not None:
-            self.write_results_to_file(translations, delays, scores)
+            self.write_results_to_file(translations, delays, scores, elapsed)
         
         return scores
 
-    def write_results_to_file(self, translations, delays, scores):
+    def write_results_to_file(self, translations, delays, scores, elapsed=None):
         if self.output_files["text"] is not None: 
             with open(self.output_files["text"], "w") as f:
                 for line in translations:
@@ -95,14 +344,13 @@ class SimulScorer(object):
         if self.output_files["delay"] is not None: 
             with open(self.output_files["delay"], "w") as f:
                 for i, delay in enumerate(delays):
-                    f.write(
-                        json.dumps(
-                            {
-                                "src_len": self.src_lengths()[i],
-                                "delays" : delay
-                            }
-                        ) + "\n"
-                    )
+                    line = {
+                        "src_len": self.src_lengths()[i],
+                        "delays" : delay
+                    }
+                    if elapsed is not None:
+                        line["elapsed"] = elapsed[i]
+                    f.write(json.dumps(line) + "\n")
 
         with open(self.output_files["scores"], "w") as f:
             for key, value in scores.items():
@@ -116,6 +364,42 @@ class SimulScorer(object):
             else:
                 return [r.strip() for r in f]
     
+    @classmethod
+    def _load_text(cls, file):
+        """Target texts of a data json, from its binary manifest if it exists"""
+        manifest_path = find_manifest(file)
+        if manifest_path is not None:
+            return cls._load_text_from_manifest(manifest_path)
+        return cls._load_text_from_json(file)
+
+    @classmethod
+    def _load_wav_info(cls, file):
+        """Audio of a data json, from its binary manifest if it exists"""
+        manifest_path = find_manifest(file)
+        if manifest_path is not None:
+            return cls._load_wav_info_from_manifest(manifest_path)
+        return cls._load_wav_info_from_json(file)
+
+    @classmethod
+    def _load_text_from_manifest(cls, manifest_path):
+        return SpeechManifest(manifest_path).texts.tolist()
+
+    @classmethod
+    def _load_wav_info_from_manifest(cls, manifest_path):
+        manifest = SpeechManifest(manifest_path)
+        return [
+            {
+                "id": utt_id,
+                "path": path,
+                "length": length
+            }
+            for utt_id, path, length in zip(
+                manifest.ids.tolist(),
+                manifest.paths.tolist(),
+                manifest.durations_ms.tolist()
+            )
+        ]
+
     @classmethod
     def _load_text_from_json(cls, file):
         list_to_return = []
@@ -130,9 +414,10 @@ class SimulScorer(object):
         list_to_return = []
         with open(file) as f:
             content = json.load(f)
-            for item in content["utts"].values():
+            for utt_id, item in content["utts"].items():
                 list_to_return.append(
                     {
+                        "id": utt_id,
                         "path": item["input"]["path"].strip(),
                         "length": item["input"]["length_ms"]
                     }
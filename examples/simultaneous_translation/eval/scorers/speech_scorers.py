@@ -1,26 +1,33 @@
 import sys
 import os
-import soundfile as sf
 sys.path.append("..") 
 from . scorer import SimulScorer
 from . import register_scorer
+from examples.simultaneous_translation.data.audio_store import (
+    PackedAudio, read_wav_mmap
+)
 
 @register_scorer("speech")
 class SimulSpeechScorer(SimulScorer):
+    computation_aware = True
+
     def __init__(self, args):
         super().__init__(args)
         if args.src_file is not None:
             sys.stderr.write(f"src_file {args.src_file} will be ignored.\n")
 
         self.tokenizer = args.tokenizer
-        self.lengths = self._load_wav_info_from_json(args.tgt_file),
         self.data = {
-            "src" : self._load_wav_info_from_json(args.tgt_file),
-            "tgt" : self._load_text_from_json(args.tgt_file)
+            "src" : self._load_wav_info(args.tgt_file),
+            "tgt" : self._load_text(args.tgt_file)
         }
         self.segment_size = args.segment_size
         self.sample_rate = args.sample_rate
         self.wav_data_type = args.wav_data_type
+        if args.packed_audio is not None:
+            self.packed_audio = PackedAudio(args.packed_audio)
+        else:
+            self.packed_audio = None
 
     @staticmethod
     def add_args(parser):
@@ -30,8 +37,12 @@ class SimulSpeechScorer(SimulScorer):
                             help='Segment size (ms)')
         parser.add_argument('--wav-data-type', type=str, default="int16",
                             help='The data type of the wav that would be transfer to client')
+        parser.add_argument('--packed-audio', type=str, default=None,
+                            help='Prefix of the packed audio of the test set '
+                            '(see data/audio_store.py), instead of reading the wav files')
 
     def send_src(self, sent_id, value):
+        self.record_event(sent_id)
         client_segment_size = value.get("segment_size", None)
         if client_segment_size is not None:
             assert client_segment_size >= self.segment_size # in ms
@@ -43,19 +54,19 @@ class SimulSpeechScorer(SimulScorer):
             and "segments" not in self.data["src"][sent_id]
         ):
             # Load audio file
-            self.data["src"][sent_id]["segments"] = self._load_audio_from_path(
-                self.data["src"][sent_id]["path"]
+            self.data["src"][sent_id]["segments"] = self._load_audio(
+                self.data["src"][sent_id]
             ) 
         
         num_segments = client_segment_size // self.segment_size
 
         if self.steps[sent_id] < self.data["src"][sent_id]["length"]:
 
-            segment = []
+            block_size = self.sample_rate // 1000 * self.segment_size
             start_idx = self.steps[sent_id] // self.segment_size 
-            for i in range(num_segments):
-                if start_idx + i < len(self.data["src"][sent_id]["segments"]):
-                    segment += self.data["src"][sent_id]["segments"][start_idx + i]
+            segment = self.data["src"][sent_id]["segments"][
+                start_idx * block_size: (start_idx + num_segments) * block_size
+            ]
 
             dict_to_return = {
                 "sent_id" : sent_id,
@@ -85,16 +96,20 @@ class SimulSpeechScorer(SimulScorer):
 
     def src_lengths(self):
         return [item["length"] for item in self.data["src"]]
+
+    def src_length(self, sent_id):
+        return self.data["src"][sent_id]["length"]
     
+    def _load_audio(self, src_info):
+        if self.packed_audio is not None:
+            samples = self.packed_audio.get(src_info["id"])
+            assert samples.dtype == self.wav_data_type
+            return samples
+        return self._load_audio_from_path(src_info["path"])
+
     def _load_audio_from_path(self, wav_path):
         assert os.path.isfile(wav_path) and wav_path.endswith('.wav')
-        frames_10ms = self.sample_rate // 1000 * self.segment_size
-        wav_blocks = [
-            b.tolist() 
-            for b in sf.blocks(
-                wav_path,
-                blocksize=frames_10ms,
-                dtype=self.wav_data_type
-                )
-        ]
-        return wav_blocks
+        # The samples are memory-mapped, only the segments which are sent
+        # are read from the disk. They are converted to lists only when
+        # sent as json
+        return read_wav_mmap(wav_path, self.wav_data_type)
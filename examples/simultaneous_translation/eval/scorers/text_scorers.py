@@ -11,6 +11,7 @@ class SimulTextScorer(SimulScorer):
         }
 
     def send_src(self, sent_id, *args):
+        self.record_event(sent_id)
         if self.steps[sent_id] >= len(self.data["src"][sent_id]):
             dict_to_return = {
                 "sent_id" : sent_id,
@@ -32,4 +33,7 @@ class SimulTextScorer(SimulScorer):
 
     def src_lengths(self):
         # +1 for eos
-        return [len(sent) + 1 for sent in self.data["src"]]
\ No newline at end of file
+        return [len(sent) + 1 for sent in self.data["src"]]
+
+    def src_length(self, sent_id):
+        return len(self.data["src"][sent_id]) + 1
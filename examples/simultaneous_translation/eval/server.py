@@ -9,11 +9,17 @@ import json
 
 from collections import defaultdict
 from tornado import web, ioloop
-from scorers import build_scorer
+from scorers import build_scorer, add_scorer_args
+from binary_protocol import pack_segment, CONTENT_TYPE
 
 DEFAULT_HOSTNAME = 'localhost'
 DEFAULT_PORT = 12321
 
+def to_json(obj):
+    # Speech segments are numpy arrays
+    return json.dumps(obj, default=lambda x: x.tolist())
+
+
 class ScorerHandler(web.RequestHandler):
     def initialize(self, scorer):
         self.scorer = scorer
@@ -25,18 +31,40 @@ class StartSessionHandler(ScorerHandler):
 
 
 class EndSessionHandler(ScorerHandler):
-    def get(self):
-        r = json.dumps(self.scorer.score())
+    async def get(self):
+        # The other requests are served while the metrics are computed
+        r = json.dumps(await self.scorer.score_async())
         self.write(r)
 
 
+class ProgressHandler(ScorerHandler):
+    def get(self):
+        # Running scores of the sentences finished so far
+        self.write(json.dumps(self.scorer.progress()))
+
+
+class ResultsHandler(ScorerHandler):
+    def get(self):
+        # Results of a worker of the sharded server
+        translations = bool(int(self.get_argument('translations', '1')))
+        self.write(json.dumps(self.scorer.get_results(translations)))
+
+
 class GetSourceHandler(ScorerHandler):
     def get(self):
         info = json.loads(self.get_argument('info'))
-        if info.get("sent_id", None) is None:
+        if isinstance(info, list):
+            # Batch of requests from several sentences
+            r = to_json(
+                [
+                    self.scorer.send_src(int(item["sent_id"]), item.get("value", None))
+                    for item in info
+                ]
+            )
+        elif info.get("sent_id", None) is None:
             r = json.dumps(self.scorer.get_info())
         else:
-            r = json.dumps(
+            r = to_json(
                 self.scorer.send_src(
                     int(info["sent_id"]),
                     info.get("value", None)
@@ -45,6 +73,21 @@ class GetSourceHandler(ScorerHandler):
         self.write(r)
 
 
+class GetBinarySourceHandler(ScorerHandler):
+    """Same as GetSourceHandler, but segments are sent as raw bytes."""
+    def get(self):
+        info = json.loads(self.get_argument('info'))
+        if not isinstance(info, list):
+            info = [info]
+        self.set_header('Content-Type', CONTENT_TYPE)
+        for item in info:
+            self.write(
+                pack_segment(
+                    self.scorer.send_src(int(item["sent_id"]), item.get("value", None))
+                )
+            )
+
+
 class SendHypothesisHandler(ScorerHandler):
     def get(self):
         self.scorer.recv_hyp(json.loads(self.get_argument('hypo')))
@@ -56,29 +99,32 @@ def add_args():
                         help='server hostname')
     parser.add_argument('--port', type=int, default=DEFAULT_PORT,
                         help='server port number')
-    parser.add_argument('--src-file', type=str,
-                        help='Source file')
-    parser.add_argument('--tgt-file', type=str,
-                        help='Target file')
-    parser.add_argument('--output', type=str,
-                        help='')
     parser.add_argument('--debug', action='store_true', help='debug mode')
-
-    parser.add_argument('--scorer-type', type=str, default="text", choices=["text", "speech"],
-                        help='Type of data to evaluate')
-    parser.add_argument('--tokenizer', default="13a", choices=["none", "13a"],
-                        help='Type of data to evaluate')
+    parser.add_argument('--num-workers', type=int, default=1,
+                        help='Number of worker processes, each of them serves '
+                        'a range of sentences')
+    parser.add_argument('--worker-base-port', type=int, default=None,
+                        help='Ports of the workers start from this port '
+                        '(default: port + 1)')
+    add_scorer_args(parser)
     args, _ = parser.parse_known_args()
     return args
 
 
-def start_server(scorer, hostname=DEFAULT_HOSTNAME, port=DEFAULT_PORT, debug=False):
-    app = web.Application([
+def build_app(scorer, debug=False):
+    return web.Application([
         (r'/start', StartSessionHandler, dict(scorer=scorer)),
         (r'/end', EndSessionHandler, dict(scorer=scorer)),
+        (r'/progress', ProgressHandler, dict(scorer=scorer)),
+        (r'/results', ResultsHandler, dict(scorer=scorer)),
         (r'/get', GetSourceHandler, dict(scorer=scorer)),
+        (r'/get_binary', GetBinarySourceHandler, dict(scorer=scorer)),
         (r'/send', SendHypothesisHandler, dict(scorer=scorer)),
     ], debug=debug)
+
+
+def start_server(scorer, hostname=DEFAULT_HOSTNAME, port=DEFAULT_PORT, debug=False):
+    app = build_app(scorer, debug)
     app.listen(port, max_buffer_size=1024 ** 3)
     sys.stdout.write(f"Evaluation Server Started. Listening to port {port}\n")
     ioloop.IOLoop.current().start()
@@ -87,4 +133,14 @@ def start_server(scorer, hostname=DEFAULT_HOSTNAME, port=DEFAULT_PORT, debug=Fal
 if __name__ == '__main__':
     args = add_args()
     scorer = build_scorer(args)
-    start_server(scorer, args.hostname, args.port, args.debug)
+    if args.num_workers > 1:
+        from sharded_server import start_sharded_server
+        start_sharded_server(
+            scorer,
+            args.num_workers,
+            args.port,
+            args.worker_base_port or args.port + 1,
+            args.debug
+        )
+    else:
+        start_server(scorer, args.hostname, args.port, args.debug)
@@ -0,0 +1,187 @@
+"""
+Evaluation server with the sentences split into shards, each served by its
+own worker process.
+
+The test set is split into contiguous ranges of sent_id. Each worker process
+owns the state (steps, translations, running scores) of one range, so the
+workers never share any state. A coordinator process listens on the public
+port and forwards each request to the worker owning its sentence. Batched
+requests are split by shard and sent to the workers concurrently. At /end,
+the coordinator merges the results of all the workers and scores the whole
+test set.
+"""
+import json
+import sys
+from collections import OrderedDict
+
+from tornado import gen, web, ioloop, netutil, process
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.httputil import url_concat
+
+from binary_protocol import split_records, CONTENT_TYPE
+from server import build_app
+
+WORKER_HOSTNAME = '127.0.0.1'
+MAX_BUFFER_SIZE = 1024 ** 3
+
+
+class CoordinatorHandler(web.RequestHandler):
+    def initialize(self, scorer, worker_urls):
+        self.scorer = scorer
+        self.worker_urls = worker_urls
+
+    def shard_id(self, sent_id):
+        return self.scorer.shard_id(int(sent_id), len(self.worker_urls))
+
+    async def fetch(self, shard_id, path, **params):
+        response = await AsyncHTTPClient().fetch(
+            url_concat(f'{self.worker_urls[shard_id]}/{path}', params)
+        )
+        return response.body
+
+    async def broadcast(self, path, **params):
+        return await gen.multi(
+            [
+                self.fetch(shard_id, path, **params)
+                for shard_id in range(len(self.worker_urls))
+            ]
+        )
+
+    async def fetch_batch(self, path, info, split):
+        """
+        Send a batch of requests to the workers owning their sentences,
+        and return the results in the order of the requests.
+        """
+        shards = OrderedDict()
+        for i, item in enumerate(info):
+            shards.setdefault(self.shard_id(item["sent_id"]), []).append(i)
+
+        bodies = await gen.multi(
+            [
+                self.fetch(
+                    shard_id, path, info=json.dumps([info[i] for i in indices])
+                )
+                for shard_id, indices in shards.items()
+            ]
+        )
+
+        results = [None] * len(info)
+        for indices, body in zip(shards.values(), bodies):
+            for i, result in zip(indices, split(body)):
+                results[i] = result
+        return results
+
+    async def merge_results(self, translations):
+        list_of_results = await self.broadcast(
+            'results', translations=int(translations)
+        )
+        self.scorer.merge_results([json.loads(r) for r in list_of_results])
+
+
+class StartSessionHandler(CoordinatorHandler):
+    async def get(self):
+        await self.broadcast('start')
+        self.scorer.reset()
+
+
+class EndSessionHandler(CoordinatorHandler):
+    async def get(self):
+        await self.merge_results(translations=True)
+        self.write(json.dumps(await self.scorer.score_async()))
+
+
+class ProgressHandler(CoordinatorHandler):
+    async def get(self):
+        await self.merge_results(translations=False)
+        self.write(json.dumps(self.scorer.progress()))
+
+
+class GetSourceHandler(CoordinatorHandler):
+    async def get(self):
+        info = json.loads(self.get_argument('info'))
+        if isinstance(info, list):
+            list_of_segments = await self.fetch_batch('get', info, json.loads)
+            self.write(json.dumps(list_of_segments))
+        elif info.get("sent_id", None) is None:
+            self.write(json.dumps(self.scorer.get_info()))
+        else:
+            self.write(
+                await self.fetch(
+                    self.shard_id(info["sent_id"]), 'get', info=json.dumps(info)
+                )
+            )
+
+
+class GetBinarySourceHandler(CoordinatorHandler):
+    async def get(self):
+        info = json.loads(self.get_argument('info'))
+        if not isinstance(info, list):
+            info = [info]
+        records = await self.fetch_batch('get_binary', info, split_records)
+        self.set_header('Content-Type', CONTENT_TYPE)
+        self.write(b''.join(records))
+
+
+class SendHypothesisHandler(CoordinatorHandler):
+    async def get(self):
+        hypos = json.loads(self.get_argument('hypo'))
+        shards = OrderedDict()
+        for sent_id, hypo in hypos.items():
+            shards.setdefault(self.shard_id(sent_id), {})[sent_id] = hypo
+
+        await gen.multi(
+            [
+                self.fetch(shard_id, 'send', hypo=json.dumps(shard_hypos))
+                for shard_id, shard_hypos in shards.items()
+            ]
+        )
+
+
+def build_coordinator_app(scorer, worker_urls, debug=False):
+    handler_args = dict(scorer=scorer, worker_urls=worker_urls)
+    return web.Application([
+        (r'/start', StartSessionHandler, handler_args),
+        (r'/end', EndSessionHandler, handler_args),
+        (r'/progress', ProgressHandler, handler_args),
+        (r'/get', GetSourceHandler, handler_args),
+        (r'/get_binary', GetBinarySourceHandler, handler_args),
+        (r'/send', SendHypothesisHandler, handler_args),
+    ], debug=debug)
+
+
+def start_sharded_server(scorer, num_workers, port, worker_base_port, debug=False):
+    # The sockets are bound before forking, so that the requests are queued
+    # until the processes are ready.
+    worker_ports = [worker_base_port + i for i in range(num_workers)]
+    list_of_sockets = [
+        netutil.bind_sockets(worker_port, address=WORKER_HOSTNAME)
+        for worker_port in worker_ports
+    ]
+    list_of_sockets.append(netutil.bind_sockets(port))
+
+    # A worker can not be restarted without losing its sentences
+    task_id = process.fork_processes(num_workers + 1, max_restarts=0)
+
+    if task_id < num_workers:
+        start, end = scorer.shard_range(task_id, num_workers)
+        app = build_app(scorer, debug)
+        sys.stdout.write(
+            f"Evaluation Worker {task_id} Started. Sentences {start} to {end - 1}, "
+            f"listening to port {worker_ports[task_id]}\n"
+        )
+    else:
+        AsyncHTTPClient.configure(None, max_clients=100 * num_workers)
+        app = build_coordinator_app(
+            scorer,
+            [f'http://{WORKER_HOSTNAME}:{worker_port}' for worker_port in worker_ports],
+            debug
+        )
+        sys.stdout.write(
+            f"Evaluation Server Started with {num_workers} workers. "
+            f"Listening to port {port}\n"
+        )
+
+    server = HTTPServer(app, max_buffer_size=MAX_BUFFER_SIZE)
+    server.add_sockets(list_of_sockets[task_id])
+    ioloop.IOLoop.current().start()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import math
 from ast import literal_eval
 from typing import List, Tuple
 
@@ -14,6 +15,7 @@ from fairseq.models import (
     register_model,
     register_model_architecture,
 )
+from fairseq.models.lstm import LSTMEncoder
 from .berard import BerardASTModel
 
 from examples.simultaneous_translation.module import (
@@ -87,27 +89,136 @@ class BerardSimulASTModel(BerardASTModel):
             self.subsampling_factor()
         )
 
-    def predict_from_states(self, states):
-        self.eval()
+    def encoder_from_states(self, states, src_indices):
+        if states.get("incremental_encoder", False):
+            # Only encode the source frames read since the last call
+            return self.encoder.incremental_forward(
+                src_indices, states["model_states"]
+            )
 
+        src_lengths = torch.LongTensor([src_indices.size(1)])
+        return self.encoder(src_indices, src_lengths)
+
+    def prev_output_tokens_from_states(self, states):
+        # The decoder states of the previous target tokens are cached
+        # in states["model_states"], only the last token is needed
+        if torch.is_tensor(states["indices"]["tgt"]):
+            return states["indices"]["tgt"][:, -1:]
+        if len(states["indices"]["tgt"]) == 0:
+            return torch.LongTensor([[self.decoder.dictionary.eos()]])
+        return torch.LongTensor([states["indices"]["tgt"][-1:]])
+
+    def src_indices_from_states(self, states):
         # bsz, src_len, feat_dim
-        src_indices = states["indices"]["src"].unsqueeze(0)
+        return states["indices"]["src"].unsqueeze(0)
 
-        tgt_indices = torch.LongTensor(
-            [
-                [self.decoder.dictionary.eos()]
-                + states["indices"]["tgt"]
-            ]
+    @staticmethod
+    def collate_encoder_outs(encoder_outs, encoder_keys=None):
+        """
+        Pad the encoder outputs of several sessions (batch of 1 each)
+        into a single batch, with the projections of their states by the
+        attention if they are given (see WaitKAttentionLayer.encoder_keys).
+        """
+        encoder_states = [
+            encoder_out["encoder_out"][0]
+            if type(encoder_out["encoder_out"]) is tuple
+            else encoder_out["encoder_out"]
+            for encoder_out in encoder_outs
+        ]
+        src_lengths = torch.LongTensor([x.size(0) for x in encoder_states])
+        max_src_len = src_lengths.max().item()
+
+        def pad(list_of_x):
+            # src_len, bsz, dim
+            padded_x = list_of_x[0].new_zeros(
+                max_src_len, len(list_of_x), list_of_x[0].size(-1)
+            )
+            for i, x in enumerate(list_of_x):
+                padded_x[: x.size(0), i] = x[:, 0]
+            return padded_x
+
+        padded_encoder_states = pad(encoder_states)
+
+        encoder_padding_mask = (
+            torch.arange(max_src_len).unsqueeze(1)
+            >= src_lengths.unsqueeze(0)
+        ).to(padded_encoder_states.device)  # (T, B)
+
+        collated_encoder_out = {
+            "encoder_out": padded_encoder_states,
+            "encoder_padding_mask": encoder_padding_mask,
+        }
+        if encoder_keys is not None:
+            collated_encoder_out["encoder_keys"] = pad(encoder_keys)
+        return collated_encoder_out
+
+    @torch.no_grad()
+    def predict_from_states_batch(self, list_of_states):
+        """
+        Predict the next target token of several sessions at once. The
+        encoders run per session (incrementally with --incremental-encoder),
+        the decoder steps and the output projection are batched.
+        """
+        self.eval()
+
+        encoder_outs = [
+            self.encoder_from_states(states, self.src_indices_from_states(states))
+            for states in list_of_states
+        ]
+        # The projections of the stable encoder states by the attention are
+        # cached in the model states of each session, as in predict_from_states
+        encoder_keys = [
+            self.decoder.attention.encoder_keys(
+                encoder_out["encoder_out"][0]
+                if type(encoder_out["encoder_out"]) is tuple
+                else encoder_out["encoder_out"],
+                states["model_states"],
+                encoder_out.get("num_stable_frames", 0),
+            )
+            for encoder_out, states in zip(encoder_outs, list_of_states)
+        ]
+        encoder_outs = self.collate_encoder_outs(encoder_outs, encoder_keys)
+
+        tgt_indices = torch.cat(
+            [self.prev_output_tokens_from_states(states) for states in list_of_states],
+            dim=0
         )
-        src_lengths = torch.LongTensor(
-            [src_indices.size(1)]
+
+        list_of_model_states = [states["model_states"] for states in list_of_states]
+        incremental_state = self.decoder.batch_incremental_states(list_of_model_states)
+
+        decoder_states, _ = self.decoder(tgt_indices, encoder_outs, incremental_state)
+
+        self.decoder.unbatch_incremental_state(incremental_state, list_of_model_states)
+
+        lprobs = self.get_normalized_probs(
+            [decoder_states[:, -1:]],
+            log_probs=True
         )
 
+        # bsz, 1
+        index = lprobs.argmax(dim=-1)
+
+        return [
+            (self.decoder.dictionary.string(index[i]), index[i].item())
+            for i in range(index.size(0))
+        ]
+
+    @torch.no_grad()
+    def predict_from_states(self, states):
+        self.eval()
+
+        src_indices = self.src_indices_from_states(states)
+
+        tgt_indices = self.prev_output_tokens_from_states(states)
+
         # Update encoder state
-        encoder_outs = self.encoder(src_indices, src_lengths)
+        encoder_outs = self.encoder_from_states(states, src_indices)
 
         # Generate decoder state
-        decoder_states, _ = self.decoder(tgt_indices, encoder_outs, states)
+        decoder_states, _ = self.decoder(
+            tgt_indices, encoder_outs, states["model_states"]
+        )
 
         lprobs = self.get_normalized_probs(
             [decoder_states[:, -1:]],
@@ -130,9 +241,8 @@ class BerardSimulTextModel(BerardSimulASTModel):
                             help='encoder embedding dimension')
     @classmethod
     def build_encoder(cls, args, task):
-        from fairseq.models.lstm import LSTMEncoder
         args.encoder_hidden_size = args.lstm_size
-        encoder = LSTMEncoder(
+        encoder = LSTMSimulEncoder(
             dictionary=task.source_dictionary,
             embed_dim=args.encoder_embed_dim,
             hidden_size=args.lstm_size,
@@ -144,38 +254,68 @@ class BerardSimulTextModel(BerardSimulASTModel):
         )
         return encoder
 
-    def predict_from_states(self, states):
-        self.eval()
-
-        src_indices = torch.LongTensor(
+    def src_indices_from_states(self, states):
+        return torch.LongTensor(
             [states["indices"]["src"][: 1 + states["steps"]["src"]]]
             )
-        src_lengths = torch.LongTensor([src_indices.size(1)])
 
 
-        tgt_indices = torch.LongTensor(
-            [
-                [self.decoder.dictionary.eos()]
-                + states["indices"]["tgt"]
-            ]
-        )
+class LSTMSimulEncoder(LSTMEncoder):
+    """Unidirectional LSTM encoder which can encode a source prefix incrementally."""
 
-        # Update encoder state
-        encoder_outs = self.encoder(src_indices, src_lengths) 
+    def incremental_forward(self, src_tokens, incremental_state):
+        """
+        Encode a growing source prefix, running the LSTM only over the tokens
+        which were not encoded by the previous call. The LSTM states and the
+        encoder outputs are cached in incremental_state.
 
-        # Generate decoder state
-        decoder_states, _ = self.decoder(tgt_indices, encoder_outs, states)
+        Args
+            src_tokens: tensor (B, T) of the source prefix read so far,
+                without padding
+            incremental_state: dictionary holding the cache of a session
+        """
+        assert not self.bidirectional
 
-        lprobs = self.get_normalized_probs(
-            [decoder_states[:, -1:]], 
-            log_probs=True
+        cached_state = utils.get_incremental_state(
+            self, incremental_state, "cached_state"
         )
+        if cached_state is not None:
+            prev_outs, prev_hiddens, prev_cells = cached_state
+            num_encoded = prev_outs.size(0)
+        else:
+            prev_outs, prev_hiddens, prev_cells = None, None, None
+            num_encoded = 0
 
-        index = lprobs.argmax(dim=-1)
+        if src_tokens.size(1) > num_encoded:
+            # embed new tokens
+            x = self.embed_tokens(src_tokens[:, num_encoded:])
+            x = F.dropout(x, p=self.dropout_in, training=self.training)
 
-        token = self.decoder.dictionary.string(index) 
+            # B x T x C -> T x B x C
+            x = x.transpose(0, 1)
 
-        return token, index.item()
+            if prev_hiddens is None:
+                x, (prev_hiddens, prev_cells) = self.lstm(x)
+            else:
+                x, (prev_hiddens, prev_cells) = self.lstm(
+                    x, (prev_hiddens, prev_cells)
+                )
+            x = F.dropout(x, p=self.dropout_out, training=self.training)
+
+            if prev_outs is not None:
+                x = torch.cat([prev_outs, x], dim=0)
+            prev_outs = x
+
+            utils.set_incremental_state(
+                self, incremental_state, "cached_state",
+                (prev_outs, prev_hiddens, prev_cells)
+            )
+
+        return {
+            'encoder_out': (prev_outs, prev_hiddens, prev_cells),
+            'encoder_padding_mask': None,
+            'num_stable_frames': prev_outs.size(0),
+        }
 
 
 class BerardSimulEncoder(FairseqEncoder):
@@ -259,11 +399,14 @@ class BerardSimulEncoder(FairseqEncoder):
         else:
             self.dropout = None
 
-    def forward(self, src_tokens, src_lengths, **kwargs):
+    def subsample(self, src_tokens):
         """
+        Apply the input and convolutional layers.
+
         Args
             src_tokens: padded tensor (B, T, C * feat)
-            src_lengths: tensor of original lengths of input utterances (B,)
+        Returns
+            tensor (T', B, C' * feat'), T' being the subsampled length
         """
         bsz, max_seq_len, _ = src_tokens.size()
         # (B, C, T, feat)
@@ -284,7 +427,112 @@ class BerardSimulEncoder(FairseqEncoder):
 
         # (B, C, T, feat) -> (B, T, C, feat) -> (T, B, C, feat) ->
         # (T, B, C * feat)
-        x = x.transpose(1, 2).transpose(0, 1).contiguous().view(output_seq_len, bsz, -1)
+        return x.transpose(1, 2).transpose(0, 1).contiguous().view(output_seq_len, bsz, -1)
+
+    def conv_receptive_field(self):
+        """
+        Returns (stride, left_context) of the convolutional layers along the
+        time axis: subsampled frame t is computed from the input frames
+        starting at stride * t - left_context.
+        """
+        stride = 1
+        left_context = 0
+        for conv_layer in self.conv_layers:
+            left_context += conv_layer.padding[0] * stride
+            stride *= conv_layer.stride[0]
+        return stride, left_context
+
+    def num_stable_frames(self, src_len):
+        """
+        Number of subsampled frames computed from a source prefix of length
+        src_len which will not change when more input frames are appended,
+        i.e. the frames whose receptive field does not reach the right padding
+        of the convolutional layers.
+        """
+        num_frames = src_len
+        for conv_layer in self.conv_layers:
+            kernel_size = conv_layer.kernel_size[0]
+            padding = conv_layer.padding[0]
+            stride = conv_layer.stride[0]
+            num_frames = max(
+                (num_frames + padding - kernel_size) // stride + 1, 0
+            )
+        return num_frames
+
+    def incremental_forward(self, src_tokens, incremental_state):
+        """
+        Encode a growing source prefix, running the LSTM only over the frames
+        which were not encoded by the previous call. The LSTM states and the
+        stable encoder outputs are cached in incremental_state.
+
+        Args
+            src_tokens: tensor (B, T, C * feat) of the source prefix read so
+                far, without padding
+            incremental_state: dictionary holding the cache of a session
+        """
+        bsz, src_len, _ = src_tokens.size()
+
+        cached_state = utils.get_incremental_state(
+            self, incremental_state, "cached_state"
+        )
+        if cached_state is not None:
+            prev_outs, prev_states = cached_state
+            num_encoded = prev_outs.size(0)
+        else:
+            prev_outs, prev_states = None, None
+            num_encoded = 0
+
+        # The convolutions are not causal, so they are run again on a window
+        # of input frames covering the receptive field of the first frame
+        # which has not been encoded yet.
+        stride, left_context = self.conv_receptive_field()
+        start = max(num_encoded - math.ceil(left_context / stride), 0)
+        x = self.subsample(src_tokens[:, start * stride:])[num_encoded - start:]
+
+        # Only the stable frames go to the cache, the remaining ones depend on
+        # the right padding and are encoded again at the next call.
+        num_new_stable = self.num_stable_frames(src_len) - num_encoded
+        if num_new_stable > 0:
+            stable_outs, prev_states = self.lstm(x[:num_new_stable], prev_states)
+            if self.dropout is not None:
+                stable_outs = self.dropout(stable_outs)
+            if prev_outs is None:
+                prev_outs = stable_outs
+            else:
+                prev_outs = torch.cat([prev_outs, stable_outs], dim=0)
+            utils.set_incremental_state(
+                self, incremental_state, "cached_state", (prev_outs, prev_states)
+            )
+        else:
+            num_new_stable = 0
+
+        num_stable_frames = 0 if prev_outs is None else prev_outs.size(0)
+
+        x = x[num_new_stable:]
+        if x.size(0) > 0:
+            x, _ = self.lstm(x, prev_states)
+            if self.dropout is not None:
+                x = self.dropout(x)
+            if prev_outs is not None:
+                x = torch.cat([prev_outs, x], dim=0)
+        else:
+            x = prev_outs
+
+        return {
+            "encoder_out": x,
+            "encoder_padding_mask": x.new_zeros(x.size(0), bsz).bool(),  # (T, B)
+            "num_stable_frames": num_stable_frames,
+        }  # (T, B, C)
+
+    def forward(self, src_tokens, src_lengths, **kwargs):
+        """
+        Args
+            src_tokens: padded tensor (B, T, C * feat)
+            src_lengths: tensor of original lengths of input utterances (B,)
+        """
+        bsz, max_seq_len, _ = src_tokens.size()
+        x = self.subsample(src_tokens)
+        output_seq_len = x.size(0)
 
         subsampling_factor = int(max_seq_len * 1.0 / output_seq_len + 0.5)
         input_lengths = (src_lengths.float() / subsampling_factor).ceil().long()
@@ -399,14 +647,34 @@ class LSTMSimulDecoder(FairseqIncrementalDecoder):
             self, incremental_state, "cached_state"
         )
         if cached_state is not None:
-            prev_hiddens, prev_cells = cached_state
+            prev_hiddens, prev_cells = map(list, cached_state)
         else:
             prev_hiddens = [x.new_zeros(bsz, self.hidden_size)] * self.num_layers
             prev_cells = [x.new_zeros(bsz, self.hidden_size)] * self.num_layers
 
+        # The projection of the encoder states used by the attention does not
+        # depend on the target step, compute it once (or take the cached
+        # projection of the stable frames during incremental decoding, or
+        # the projection of a batch of sessions, see predict_from_states_batch)
+        encoder_keys = encoder_out.get("encoder_keys", None)
+        if encoder_keys is None:
+            encoder_keys = self.attention.encoder_keys(
+                encoder_outs,
+                incremental_state,
+                encoder_out.get("num_stable_frames", 0)
+            )
+
+        # In training, the source states which are not read yet at each
+        # target step, tgt_len x src_len
+        if incremental_state is None:
+            waitk_mask = self.attention.waitk_mask(seqlen, srclen).to(x.device)
+        else:
+            waitk_mask = None
+
         #attn_scores = x.new_zeros(bsz, srclen)
         prev_alpha = None
         attention_outs = []
+        attn_scores = []
         outs = []
         for j in range(seqlen):
             input = x[j, :, :]
@@ -428,17 +696,18 @@ class LSTMSimulDecoder(FairseqIncrementalDecoder):
                 prev_cells[i] = cell
 
                 if attention_out is None:
-                    if incremental_state is None:
-                        self.attention.set_target_step(j)
-                    attention_out = self.attention(
+                    attention_out, attn = self.attention(
                         hidden, 
                         encoder_outs, 
                         encoder_padding_mask,
-                        incremental_state
+                        incremental_state,
+                        encoder_keys,
+                        waitk_mask[j] if waitk_mask is not None else None
                     )
                     if self.dropout is not None:
                         attention_out = self.dropout(attention_out)
                     attention_outs.append(attention_out)
+                    attn_scores.append(attn)
                 input = attention_out
 
             # collect the output of the top layer
@@ -470,11 +739,75 @@ class LSTMSimulDecoder(FairseqIncrementalDecoder):
         # project back to size of vocabulary
         x = self.output_projection(x)
 
-        # to return the full attn_scores tensor, we need to fix the decoder
-        # to account for subsampling input frames
-        # tgt_len, bsz, src_len
+        # attention weights over the subsampled encoder states
+        # src_len x bsz (x tgt_len) -> bsz x tgt_len x src_len
+        attn_scores = torch.stack(attn_scores, dim=2).permute(1, 2, 0)
+
+        return x, {
+            'encoder_padding_mask' : encoder_padding_mask,
+            'attn': attn_scores
+        }
+
+    def batch_incremental_states(self, incremental_states):
+        """
+        Merge the cached LSTM states of several sessions (batch of 1 each)
+        into a new incremental state. Sessions without cache start from
+        zero states.
+        """
+        # Not the weights of a linear layer, which are packed once quantized
+        zero_state = self.embed_tokens.weight.new_zeros(1, self.hidden_size)
+        cached_states = [
+            utils.get_incremental_state(self, incremental_state, "cached_state")
+            for incremental_state in incremental_states
+        ]
+
+        def merge(index):
+            return [
+                torch.cat(
+                    [
+                        zero_state if cached_state is None else cached_state[index][i]
+                        for cached_state in cached_states
+                    ],
+                    dim=0
+                )
+                for i in range(self.num_layers)
+            ]
+
+        batch_incremental_state = {}
+        utils.set_incremental_state(
+            self, batch_incremental_state, "cached_state", (merge(0), merge(1))
+        )
+        return batch_incremental_state
+
+    def unbatch_incremental_state(self, batch_incremental_state, incremental_states):
+        """Inverse of batch_incremental_states."""
+        prev_hiddens, prev_cells = utils.get_incremental_state(
+            self, batch_incremental_state, "cached_state"
+        )
+        for i, incremental_state in enumerate(incremental_states):
+            utils.set_incremental_state(
+                self, incremental_state, "cached_state",
+                (
+                    [hidden[i: i + 1] for hidden in prev_hiddens],
+                    [cell[i: i + 1] for cell in prev_cells],
+                )
+            )
+
+    def reorder_incremental_state(self, incremental_state, new_order):
+        super().reorder_incremental_state(incremental_state, new_order)
+        cached_state = utils.get_incremental_state(
+            self, incremental_state, "cached_state"
+        )
+        if cached_state is None:
+            return
+
+        def reorder_state(state):
+            if isinstance(state, list):
+                return [reorder_state(state_i) for state_i in state]
+            return state.index_select(0, new_order)
 
-        return x, {'encoder_padding_mask' : encoder_padding_mask}
+        new_state = tuple(map(reorder_state, cached_state))
+        utils.set_incremental_state(self, incremental_state, "cached_state", new_state)
 
 
 @register_model_architecture(model_name="berard_simul", arch_name="berard_simul_ast")
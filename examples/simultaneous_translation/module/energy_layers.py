@@ -21,13 +21,27 @@ class EnergyLayer(nn.Module):
     def _init_modules(self):
         raise NotImplementedError
 
-    def forward(self, input, source_hids, encoder_padding_mask, exponential=False):
-        energy = self.calculate_energy(input, source_hids, encoder_padding_mask)
+    def forward(
+        self, input, source_hids, encoder_padding_mask,
+        exponential=False, encoder_component=None
+    ):
+        energy = self.calculate_energy(
+            input, source_hids, encoder_padding_mask, encoder_component
+        )
         if exponential:
             energy = torch.exp(energy)
         return energy
 
-    def calculate_energy(self, input, source_hids, encoder_padding_mask):
+    def project_source(self, source_hids):
+        """
+        Decoder independent part of the energy, which can be computed once
+        and passed to forward as encoder_component.
+        """
+        raise NotImplementedError
+
+    def calculate_energy(
+        self, input, source_hids, encoder_padding_mask, encoder_component=None
+    ):
         raise NotImplementedError
 
 
@@ -49,20 +63,34 @@ class AdditiveEnergyLayer(EnergyLayer):
             self.to_scores = nn.Linear(self.attention_dim, 1, bias=False)
             self.r = self.init_bias
 
-    def calculate_energy(self, input, source_hids, encoder_padding_mask):
+    def project_source(self, source_hids):
         """
-        input: bsz x decoder_hidden_state_dim
         source_hids: src_len x bsz x context_dim
-        encoder_padding_mask: src_len x bsz
+        return: src_len x bsz x attention_dim
         """
-        _, input_dim = input.size()
         src_len, bsz, context_dim = source_hids.size()
         # (src_len*bsz) x context_dim (to feed through linear)
-        flat_source_hids = source_hids.view(-1, self.context_dim)
+        flat_source_hids = source_hids.contiguous().view(-1, self.context_dim)
         # (src_len*bsz) x attention_dim
         encoder_component = self.encoder_proj(flat_source_hids)
         # src_len x bsz x attention_dim
-        encoder_component = encoder_component.view(src_len, bsz, self.attention_dim)
+        return encoder_component.view(src_len, bsz, self.attention_dim)
+
+    def calculate_energy(
+        self, input, source_hids, encoder_padding_mask, encoder_component=None
+    ):
+        """
+        input: bsz x decoder_hidden_state_dim
+        source_hids: src_len x bsz x context_dim
+        encoder_padding_mask: src_len x bsz
+        encoder_component: src_len x bsz x attention_dim, optional
+            precomputed output of project_source(source_hids)
+        """
+        _, input_dim = input.size()
+        src_len, bsz, context_dim = source_hids.size()
+        if encoder_component is None:
+            # src_len x bsz x attention_dim
+            encoder_component = self.project_source(source_hids)
         # 1 x bsz x attention_dim
         decoder_component = self.decoder_proj(input).unsqueeze(0)
         # Sum with broadcasting and apply the non linearity
@@ -24,8 +24,6 @@ class WaitKAttentionLayer(nn.Module):
 
         self.waitk_stride = self.waitk * self.stride
 
-        self.target_step = 0
-
         self.eps = 1e-8
 
         self.online_decode = True
@@ -53,6 +51,8 @@ class WaitKAttentionLayer(nn.Module):
         source_hids,
         encoder_padding_mask,
         incremental_state=None,
+        encoder_keys=None,
+        attn_mask=None,
         *args, **kargs
     ):
         """
@@ -62,8 +62,17 @@ class WaitKAttentionLayer(nn.Module):
         source_hids: src_len x bsz x context_dim
         encoder_padding_mask: src_len x bsz
         previous_attention: src_len x bsz
+        encoder_keys: src_len x bsz x attention_dim, see encoder_keys()
+        attn_mask: src_len (x bsz), the row of waitk_mask() of the target step
+
+        return:
+        output: bsz x context_dim
+        attn: src_len x bsz
         """
-        attn = self.attn_scores(input, source_hids, encoder_padding_mask, incremental_state)
+        attn = self.attn_scores(
+            input, source_hids, encoder_padding_mask, incremental_state,
+            encoder_keys, attn_mask
+        )
 
         # Sum weighted sources (bsz x context_dim)
         weighted_context = (
@@ -73,42 +82,115 @@ class WaitKAttentionLayer(nn.Module):
         #output = torch.tanh(self.output_proj(torch.cat([weighted_context, input], dim=1)))
         output = weighted_context
 
-        return output
+        return output, attn
 
     def attn_scores(
         self,
         decoder_state,
         encoder_states,
         encoder_padding_mask,
-        incremental_state
+        incremental_state,
+        encoder_keys=None,
+        attn_mask=None
     ):
         src_len, bsz, _ = encoder_states.size()
         softattn_energy = self.softattn_energy_layer(
-            decoder_state, encoder_states, encoder_padding_mask, exponential=False
-        ) 
+            decoder_state, encoder_states, encoder_padding_mask,
+            exponential=False, encoder_component=encoder_keys
+        )
         softattn_energy_max, _ = torch.max(softattn_energy, dim=0)
         exp_softattn_energy = torch.exp(softattn_energy - softattn_energy_max) + self.eps
 
-        if incremental_state is None:
-            exp_softattn_energy[self.get_encoder_pointer(src_len) + 1:] = 0
+        if attn_mask is not None:
+            if attn_mask.dim() == 1:
+                attn_mask = attn_mask.unsqueeze(1)
+            exp_softattn_energy = exp_softattn_energy.masked_fill(attn_mask, 0)
+
+        if encoder_padding_mask is not None:
+            exp_softattn_energy = exp_softattn_energy.masked_fill(
+                encoder_padding_mask, 0
+            )
         
         beta = exp_softattn_energy / exp_softattn_energy.sum(dim=0, keepdim=True)
            
         return beta
 
-    def get_pointer(self, src_len):
-        pointer = self.get_target_step() + self.waitk - 1
-        pointer_stride = min((pointer + 1) * self.stride, src_len - 1)
-        return pointer, pointer_stride
-    
-    def get_encoder_pointer(self, src_len):
-        return self.get_pointer(src_len)[-1]
+    def encoder_keys(self, encoder_states, incremental_state=None, num_stable_frames=0):
+        """
+        Project the encoder states for the energy layer. During incremental
+        decoding the projections of the first num_stable_frames frames, which
+        will not change at later steps, are cached so that only new frames
+        are projected.
 
-    def set_target_step(self, step):
-        self.target_step = step
+        encoder_states: src_len x bsz x context_dim
+        return: src_len x bsz x attention_dim
+        """
+        if incremental_state is None or num_stable_frames == 0:
+            return self.softattn_energy_layer.project_source(encoder_states)
+
+        cached_keys = utils.get_incremental_state(
+            self, incremental_state, "encoder_keys"
+        )
+        num_cached = 0 if cached_keys is None else cached_keys.size(0)
+
+        if num_stable_frames > num_cached:
+            new_keys = self.softattn_energy_layer.project_source(
+                encoder_states[num_cached: num_stable_frames]
+            )
+            if cached_keys is None:
+                cached_keys = new_keys
+            else:
+                cached_keys = torch.cat([cached_keys, new_keys], dim=0)
+            num_cached = num_stable_frames
+            utils.set_incremental_state(
+                self, incremental_state, "encoder_keys", cached_keys
+            )
+
+        if encoder_states.size(0) > num_cached:
+            return torch.cat(
+                [
+                    cached_keys,
+                    self.softattn_energy_layer.project_source(
+                        encoder_states[num_cached:]
+                    )
+                ],
+                dim=0
+            )
+        return cached_keys
+
+    def reorder_incremental_state(self, incremental_state, new_order):
+        cached_keys = utils.get_incremental_state(
+            self, incremental_state, "encoder_keys"
+        )
+        if cached_keys is not None:
+            utils.set_incremental_state(
+                self, incremental_state, "encoder_keys",
+                cached_keys.index_select(1, new_order)
+            )
 
-    def get_target_step(self):
-        return self.target_step
+    def waitk_mask(self, tgt_len, src_len, waitk=None):
+        """
+        Mask of the source states which are not read yet at each target
+        step in training, True for the masked states. At step i, the states
+        up to (i + waitk) * stride are attended.
+
+        waitk: lagging, either an int (default: --waitk-lagging) or a
+            tensor of laggings of each sentence of size bsz
+        return: tgt_len x src_len, or tgt_len x src_len x bsz if waitk
+            is a tensor
+        """
+        if waitk is None:
+            waitk = self.waitk
+
+        steps = torch.arange(tgt_len).view(tgt_len, 1)
+        positions = torch.arange(src_len).view(1, src_len)
+        if torch.is_tensor(waitk):
+            steps = steps.unsqueeze(2)
+            positions = positions.unsqueeze(2)
+            waitk = waitk.view(1, 1, -1).cpu()
+
+        pointers = ((steps + waitk) * self.stride).clamp(max=src_len - 1)
+        return positions > pointers
     
     def decision_from_states(self, states, frame_shift=1, subsampling_factor=1):
         if len(states["indices"]["src"]) == 0:
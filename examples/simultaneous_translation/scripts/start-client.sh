@@ -42,7 +42,7 @@ python $user_dir/eval/evaluate.py \
     --src-splitter-path $src_splitter_path \
     --tgt-splitter-type $tgt_splitter_type \
     --tgt-splitter-path $tgt_splitter_path \
-    --model-path $model \
+    --model-path $model $agent_args \
     --reset-server \
     --num-threads 4 \
     --scores
@@ -48,7 +48,7 @@ do
         --src-splitter-path $src_splitter_path \
         --tgt-splitter-type $tgt_splitter_type \
         --tgt-splitter-path $tgt_splitter_path \
-        --model-path $model \
+        --model-path $model $agent_args \
         --num-threads 4 \
         --start-idx $((i * chunk_size))\
         --end-idx $(((i + 1) * chunk_size - 1)) &
@@ -32,6 +32,7 @@ python -u $user_dir/eval/server.py \
     --tgt-file $tgt \
     --scorer-type $scorer_type \
     --output $result_dir/eval \
+    --num-workers ${num_workers:-1} \
     --port $port
 exit
 
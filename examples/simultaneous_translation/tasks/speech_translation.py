@@ -7,12 +7,31 @@ import json
 import os
 import re
 
+import numpy as np
 import torch
 from fairseq.data import Dictionary
 from fairseq.tasks import FairseqTask, register_task
 from examples.simultaneous_translation.data import AstDataset
+from examples.simultaneous_translation.data.audio_store import PackedAudio
+from examples.simultaneous_translation.data.feature_store import FbankFeatures
+from examples.simultaneous_translation.data.manifest import (
+    SpeechManifest,
+    TargetsWithEos,
+    find_manifest,
+)
+from examples.simultaneous_translation.utils.waitk_generator import (
+    WaitKSequenceGenerator,
+)
 
-def get_ast_dataset_from_json(data_json_path, tgt_dict, num_mel_bins=80):
+# Frame length and shift (ms) of the filter bank features of AstDataset
+FRAME_LENGTH = 25.0
+FRAME_SHIFT = 10.0
+
+
+def get_ast_dataset_from_json(
+    data_json_path, tgt_dict, num_mel_bins=80, features=None, num_buckets=0,
+    shuffle=False, audio=None
+):
     """
     Parse data json and create dataset.
     See scripts/asr_prep_json.py which pack json from raw files
@@ -59,7 +78,38 @@ def get_ast_dataset_from_json(data_json_path, tgt_dict, num_mel_bins=80):
         ]
         # append eos
         tgt = [torch.cat([t, torch.LongTensor([tgt_dict.eos()])]) for t in tgt]
-        return AstDataset(aud_paths, frame_sizes, tgt, tgt_dict, ids, speakers, num_mel_bins)
+        return AstDataset(
+            aud_paths, frame_sizes, tgt, tgt_dict, ids, speakers, num_mel_bins,
+            features=features, num_buckets=num_buckets, shuffle=shuffle,
+            audio=audio
+        )
+
+
+def get_ast_dataset_from_manifest(
+    manifest_path, tgt_dict, num_mel_bins=80, features=None, num_buckets=0,
+    shuffle=False, audio=None
+):
+    """
+    Same as get_ast_dataset_from_json, from the binary manifest of the
+    data json (see data/manifest.py).
+    """
+    manifest = SpeechManifest(manifest_path)
+    assert len(manifest) != 0
+    # Sorted by duration in descending order, as in get_ast_dataset_from_json
+    order = np.argsort(-manifest.durations_ms, kind="mergesort")
+    return AstDataset(
+        manifest.paths[order].tolist(),
+        manifest.durations_ms[order].tolist(),
+        TargetsWithEos(manifest.targets, order, tgt_dict.eos()),
+        tgt_dict,
+        manifest.ids[order].tolist(),
+        manifest.speakers[order].tolist(),
+        num_mel_bins,
+        features=features,
+        num_buckets=num_buckets,
+        shuffle=shuffle,
+        audio=audio,
+    )
 
 
 @register_task("speech_translation")
@@ -75,6 +125,23 @@ class SpeechTranslationTask(FairseqTask):
         parser.add_argument(
             "--silence-#token", default="\u2581", help="token for silence (used by w2l)"
         )
+        parser.add_argument(
+            "--num-buckets", type=int, default=0,
+            help="group the utterances in buckets with similar numbers of "
+            "frames, and shuffle the training utterances within each bucket "
+            "at each epoch (0 to keep the utterances sorted by duration)"
+        )
+        parser.add_argument(
+            "--simul-generation", action="store_true",
+            help="generate with the wait-k policy of the speech agent instead "
+            "of beam search on the whole utterances (greedy, see "
+            "utils/waitk_generator.py)"
+        )
+        parser.add_argument(
+            "--simul-delay-output", default=None,
+            help="with --simul-generation, write the delays of the hypotheses "
+            "to this file, in the format of the .delay file of the server"
+        )
 
     def __init__(self, args, tgt_dict):
         super().__init__(args)
@@ -102,13 +169,92 @@ class SpeechTranslationTask(FairseqTask):
             split (str): name of the split (e.g., train, valid, test)
         """
         data_json_path = os.path.join(self.args.data, "{}.json".format(split))
-        self.datasets[split] = get_ast_dataset_from_json(
-            data_json_path,
+        # Precomputed features, see data/feature_store.py
+        feature_prefix = os.path.join(self.args.data, "{}.fbank".format(split))
+        features = None
+        if FbankFeatures.exists(feature_prefix):
+            features = FbankFeatures(feature_prefix)
+            # The features must be the ones AstDataset and the agents compute
+            mismatches = [
+                "{} {} instead of {}".format(value, name, expected)
+                for name, value, expected in [
+                    ("mel bins", features.num_mel_bins, self.num_mel_bins),
+                    ("ms frame length", features.frame_length, FRAME_LENGTH),
+                    ("ms frame shift", features.frame_shift, FRAME_SHIFT),
+                ]
+                if value != expected
+            ]
+            if len(mismatches) > 0:
+                print(
+                    "| ignore {}: {}".format(feature_prefix, ", ".join(mismatches))
+                )
+                features = None
+            else:
+                print("| {}: precomputed features from {}".format(split, feature_prefix))
+
+        # Packed audio of the utterances, see data/segment_wav.py
+        audio_prefix = os.path.join(self.args.data, "{}.audio".format(split))
+        audio = None
+        if features is None and PackedAudio.exists(audio_prefix):
+            audio = PackedAudio(audio_prefix)
+            print("| {}: packed audio from {}".format(split, audio_prefix))
+
+        # Binary manifest of the data json, see data/manifest.py
+        manifest_path = find_manifest(data_json_path)
+        if manifest_path is not None:
+            print("| {}: loading {}".format(split, manifest_path))
+            get_ast_dataset = get_ast_dataset_from_manifest
+        else:
+            manifest_path = data_json_path
+            get_ast_dataset = get_ast_dataset_from_json
+
+        self.datasets[split] = get_ast_dataset(
+            manifest_path,
             self.tgt_dict, 
-            self.num_mel_bins
+            self.num_mel_bins,
+            features,
+            num_buckets=getattr(self.args, "num_buckets", 0),
+            shuffle=(split == getattr(self.args, "train_subset", "train")),
+            audio=audio,
         )
 
+    def get_batch_iterator(
+        self, dataset, max_tokens=None, max_sentences=None, max_positions=None,
+        ignore_invalid_inputs=False, required_batch_size_multiple=1,
+        seed=1, num_shards=1, shard_id=0, num_workers=0, epoch=0,
+    ):
+        shuffled = (
+            isinstance(dataset, AstDataset)
+            and dataset.num_buckets > 0
+            and dataset.shuffle
+        )
+        if shuffled:
+            # The batches change at each epoch
+            self.dataset_to_epoch_iter.pop(dataset, None)
+        cached = dataset in self.dataset_to_epoch_iter
+
+        epoch_iter = super().get_batch_iterator(
+            dataset, max_tokens, max_sentences, max_positions,
+            ignore_invalid_inputs, required_batch_size_multiple,
+            seed, num_shards, shard_id, num_workers, epoch,
+        )
+
+        if isinstance(dataset, AstDataset) and not cached:
+            print(
+                "| {} batches, {:.2%} of padded frames".format(
+                    len(epoch_iter.frozen_batches),
+                    dataset.padding_ratio(epoch_iter.frozen_batches)
+                )
+            )
+        return epoch_iter
+
     def build_generator(self, args):
+        if getattr(args, "simul_generation", False):
+            return WaitKSequenceGenerator(
+                self.target_dictionary,
+                max_len=args.max_len_b,
+                delay_output=getattr(args, "simul_delay_output", None),
+            )
         return super().build_generator(args)
 
     @property
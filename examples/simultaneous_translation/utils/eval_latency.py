@@ -3,40 +3,86 @@ import argparse
 import torch
 import json
 
+METRICS = [
+    'differentiable_average_lagging',
+    'average_lagging',
+    'average_proportion'
+]
+
+
 class LatencyScorer():
-    def __init__(self, start_from_zero=True):
-        self.recorder = []
+    """
+    Latency of a corpus. With computation_aware, the delays are the elapsed
+    times (source consumed plus computation time, in ms) from the "elapsed"
+    field instead of "delays", and are not clipped to the source length.
+    """
+    def __init__(self, start_from_zero=True, computation_aware=False):
+        self.recorder = {}
         self.scores = {}
         self.scorer = LatencyInference() 
         self.start_from_zero = start_from_zero
-    
+        self.computation_aware = computation_aware
+
+    @staticmethod
+    def collate_delays(list_of_delays, offset=0, dtype=torch.long):
+        """
+        Pad the delays of all the sentences in a single tensor.
+
+        Returns:
+            delays: bsz, max_tgt_len
+            target_padding_mask: bsz, max_tgt_len
+        """
+        tgt_lens = torch.LongTensor([len(delays) for delays in list_of_delays])
+        max_tgt_len = int(tgt_lens.max()) if len(list_of_delays) > 0 else 0
+        target_padding_mask = (
+            torch.arange(max_tgt_len).unsqueeze(0) >= tgt_lens.unsqueeze(1)
+        )
+        delays = torch.zeros(len(list_of_delays), max_tgt_len, dtype=dtype)
+        # Row major order, same as the concatenation of the delays
+        delays[~target_padding_mask] = torch.tensor(
+            [x for delays in list_of_delays for x in delays], dtype=dtype
+        ) - offset
+
+        return delays, target_padding_mask
+
     def update_reorder(self, list_of_dict):
-        self.recorder = []
-        for info in list_of_dict:
-            delays = [
-                int(x) - int(not self.start_from_zero)  
-                for x in info["delays"]
-            ]
-            delays = torch.LongTensor(delays).unsqueeze(0)
-            src_len = torch.LongTensor([info["src_len"]]).unsqueeze(0)
+        src_lens = torch.LongTensor(
+            [info["src_len"] for info in list_of_dict]
+        ).unsqueeze(1)
+
+        if self.computation_aware:
+            delays, target_padding_mask = self.collate_delays(
+                [info["elapsed"] for info in list_of_dict], dtype=torch.float
+            )
+            # Scores of all the sentences, bsz x 1
+            self.recorder = {
+                key: func(
+                    delays, src_lens.float(),
+                    target_padding_mask=target_padding_mask,
+                    batch_first=True,
+                    start_from_zero=self.start_from_zero
+                ).t()
+                for key, func in self.scorer.metric_calculator.items()
+            }
+            return
+
+        delays, target_padding_mask = self.collate_delays(
+            [[int(x) for x in info["delays"]] for info in list_of_dict],
+            offset=int(not self.start_from_zero)
+        )
 
-            self.recorder.append(self.scorer(delays, src_len))
+        # Scores of all the sentences, bsz x 1
+        self.recorder = self.scorer(delays, src_lens, target_padding_mask)
 
     def cal_latency(self):
         self.scores = {}
-        for metric in [
-            'differentiable_average_lagging', 
-            'average_lagging', 
-            'average_proportion'
-            ]:
-            self.scores[metric] = sum(
-                [x[metric][0, 0].item() for x in self.recorder]
-            ) / len(self.recorder)
+        for metric in METRICS:
+            self.scores[metric] = self.recorder[metric].mean().item()
         return self.scores
     
     @classmethod
-    def score(cls, list_of_dict, start_from_zero=True):
-        scorer_to_return = cls(start_from_zero)
+    def score(cls, list_of_dict, start_from_zero=True, computation_aware=False):
+        scorer_to_return = cls(start_from_zero, computation_aware)
         scorer_to_return.update_reorder(list_of_dict)
         scorer_to_return.cal_latency()
         return scorer_to_return.scores
@@ -47,31 +93,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", required=True)
     parser.add_argument("--start-from-zero", action="store_true")
+    parser.add_argument("--computation-aware", action="store_true",
+                        help="use the elapsed times instead of the delays")
     args = parser.parse_args()
 
-    scorer = LatencyInference()
-    recorder = []
     with open(args.input, 'r') as f:
-        for line in f:
-            info = json.loads(line)
+        list_of_dict = [json.loads(line) for line in f]
 
-            delays = [
-                int(x) - int(not args.start_from_zero)  
-                for x in info["delays"]
-            ]
-
-            delays = torch.LongTensor(delays).unsqueeze(0)
-            src_len = torch.LongTensor([info["src_len"]]).unsqueeze(0)
-
-            recorder.append(scorer(delays, src_len))
-    
-    average_results = {}
-    for metric in [
-        'differentiable_average_lagging', 
-        'average_lagging', 
-        'average_proportion'
-        ]:
-        average_results[metric] = sum(
-            [x[metric][0, 0].item() for x in recorder]
-        ) / len(recorder)
+    average_results = LatencyScorer.score(
+        list_of_dict, args.start_from_zero, args.computation_aware
+    )
+    for metric in METRICS:
         print(f"{metric}: {average_results[metric]}")
@@ -0,0 +1,247 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Inference bundle of a model: the weights of a training checkpoint, without
+the optimizer and training state, with the model args and the
+dictionaries. The weights are packed in <prefix>.bin and the rest is stored
+in the index <prefix>.idx (see data/indexed_arrays.py), so that loading a
+bundle doesn't need the data directory of the task.
+
+The weights are memory-mapped: with float32 weights, the agents running on
+the same host share the pages of the bundle instead of each holding a copy
+of the model.
+
+    python utils/inference_bundle.py \
+        --checkpoint checkpoint_best.pt --output-prefix model.bundle
+"""
+
+import argparse
+import io
+import json
+import warnings
+from functools import reduce
+
+import torch
+from fairseq.data import Dictionary
+
+from examples.simultaneous_translation.data.indexed_arrays import (
+    IndexedArrays,
+    IndexedArraysWriter,
+)
+
+
+class _BundleTask(object):
+    """The dictionaries of the task, which is all build_model needs"""
+
+    def __init__(self, source_dictionary, target_dictionary):
+        self.source_dictionary = source_dictionary
+        self.target_dictionary = target_dictionary
+
+
+def _json_args(args):
+    """The args which can be stored in json"""
+    json_args = {}
+    for key, value in vars(args).items():
+        try:
+            json.dumps(value)
+        except TypeError:
+            warnings.warn("argument {} is not stored in the bundle".format(key))
+            continue
+        json_args[key] = value
+    return json_args
+
+
+def export_bundle(
+    checkpoint_path, prefix_path, dtype='float32', quantize=False, arg_overrides=None
+):
+    """
+    Write the inference bundle of a checkpoint. The dictionaries are loaded
+    by the task of the checkpoint.
+
+    Args:
+        dtype (str): data type of the stored weights, float32 or float16
+        quantize (bool): quantize the model when it is loaded (see
+            --quantize of the agents)
+        arg_overrides (dict): override the model args of the checkpoint
+    """
+    from fairseq import checkpoint_utils, tasks
+
+    state = checkpoint_utils.load_checkpoint_to_cpu(checkpoint_path, arg_overrides)
+    args = state["args"]
+    task = tasks.setup_task(args)
+
+    dictionaries = {
+        "src": task.source_dictionary, "tgt": task.target_dictionary
+    }
+    write_bundle(prefix_path, args, state["model"], dictionaries, dtype, quantize)
+
+
+def write_bundle(prefix_path, args, model_state, dictionaries, dtype='float32',
+                 quantize=False):
+    """
+    Write an inference bundle from the args, the state dict and the
+    dictionaries ({"src": ..., "tgt": ...}, None if there is none) of a
+    model. See export_bundle.
+    """
+    dictionary_texts = {}
+    for key, dictionary in dictionaries.items():
+        if dictionary is not None:
+            f = io.StringIO()
+            dictionary.save(f)
+            dictionary_texts[key] = f.getvalue()
+
+    writer = IndexedArraysWriter(prefix_path, dtype)
+    tensors = {}
+    for name, tensor in model_state.items():
+        tensors[name] = {
+            "shape": list(tensor.size()),
+            "dtype": str(tensor.dtype).replace("torch.", ""),
+        }
+        if tensor.is_floating_point():
+            writer.add_item(name, tensor.cpu().float().numpy().reshape(-1))
+        else:
+            # Integer buffers (e.g. counters) are small, and they are stored
+            # exactly in the index rather than in the dtype of the weights
+            tensors[name]["values"] = tensor.cpu().reshape(-1).tolist()
+
+    writer.metadata = {
+        "args": _json_args(args),
+        "dictionaries": dictionary_texts,
+        "tensors": tensors,
+        "quantize": quantize,
+    }
+    writer.finalize()
+
+
+class InferenceBundle(IndexedArrays):
+    """
+    Read-only inference bundle.
+
+    Args:
+        prefix_path (str): the bundle is stored in <prefix_path>.bin and
+            <prefix_path>.idx, see export_bundle
+    """
+
+    @property
+    def args(self):
+        return argparse.Namespace(**self.metadata["args"])
+
+    @property
+    def quantize(self):
+        return self.metadata["quantize"]
+
+    def dictionary(self, key):
+        """Source ("src") or target ("tgt") dictionary, None if there is none"""
+        if key not in self.metadata["dictionaries"]:
+            return None
+        return Dictionary.load(io.StringIO(self.metadata["dictionaries"][key]))
+
+    def state_dict(self):
+        """
+        Tensors of the model. The float32 tensors are views of the memory-
+        mapped weights, the other ones are copies. The integer tensors are
+        stored in the index.
+        """
+        state_dict = {}
+        with warnings.catch_warnings():
+            # The memory-mapped weights are read-only
+            warnings.simplefilter("ignore", UserWarning)
+            for name, info in self.metadata["tensors"].items():
+                dtype = getattr(torch, info["dtype"])
+                if "values" in info:
+                    state_dict[name] = torch.tensor(
+                        info["values"], dtype=dtype
+                    ).reshape(info["shape"])
+                    continue
+                array = self.get(name).reshape(info["shape"])
+                tensor = torch.from_numpy(array)
+                if tensor.dtype != dtype:
+                    tensor = tensor.to(dtype)
+                state_dict[name] = tensor
+        return state_dict
+
+    def build_model(self, args=None):
+        """
+        Build the model of the bundle and replace its parameters and
+        buffers by the tensors of the bundle, without copying them.
+
+        Returns:
+            (model, task) where task has the source_dictionary and
+            target_dictionary of the bundle
+        """
+        from fairseq.models import ARCH_MODEL_REGISTRY
+
+        if args is None:
+            args = self.args
+        task = _BundleTask(self.dictionary("src"), self.dictionary("tgt"))
+        model = ARCH_MODEL_REGISTRY[args.arch].build_model(args, task)
+
+        state_dict = self.state_dict()
+        expected_names = set(model.state_dict().keys())
+        if expected_names != set(state_dict.keys()):
+            raise KeyError(
+                "The tensors of the bundle don't match the model: "
+                "missing {}, unexpected {}".format(
+                    sorted(expected_names - set(state_dict.keys())),
+                    sorted(set(state_dict.keys()) - expected_names),
+                )
+            )
+
+        for name, tensor in state_dict.items():
+            module_name, _, tensor_name = name.rpartition(".")
+            module = reduce(getattr, module_name.split(".") if module_name else [], model)
+            # setattr, so that the modules caching their parameters (e.g.
+            # the flat weights of nn.LSTM) see the new ones
+            if tensor_name in module._parameters:
+                setattr(
+                    module, tensor_name,
+                    torch.nn.Parameter(tensor, requires_grad=False)
+                )
+            else:
+                setattr(module, tensor_name, tensor)
+
+        for module in model.modules():
+            if isinstance(module, torch.nn.RNNBase) and hasattr(
+                module, "_init_flat_weights"
+            ):
+                module._init_flat_weights()
+        return model, task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export a checkpoint to an inference bundle"
+    )
+    parser.add_argument("--checkpoint", required=True,
+                        help="training checkpoint")
+    parser.add_argument("--output-prefix", required=True,
+                        help="write <output-prefix>.bin and <output-prefix>.idx")
+    parser.add_argument("--user-dir", default=None,
+                        help="user directory of the model and the task "
+                        "(default: examples/simultaneous_translation)")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"],
+                        help="data type of the stored weights. float16 halves the "
+                        "size of the bundle, but the weights are then converted "
+                        "when loaded and the pages are not shared by the agents")
+    parser.add_argument("--quantize", action="store_true",
+                        help="apply dynamic int8 quantization to the model when "
+                        "the bundle is loaded by an agent")
+    parser.add_argument("--model-overrides", default="{}", type=str, metavar="DICT",
+                        help="a dictionary used to override model args, e.g. the "
+                        "data directory of the task to load the dictionaries")
+    args = parser.parse_args()
+
+    import os
+    from ast import literal_eval
+    from fairseq import utils
+
+    if args.user_dir is None:
+        args.user_dir = os.path.join(os.path.dirname(__file__), "..")
+    utils.import_user_module(args)
+
+    export_bundle(
+        args.checkpoint, args.output_prefix, args.dtype, args.quantize,
+        literal_eval(args.model_overrides)
+    )
@@ -23,17 +23,18 @@ class LatencyMetric(object):
             # convert to batch_last
             delays = delays.t()
             src_lens = src_lens.t()
-            tgt_len, bsz = delays.size()
-            _, bsz_1 = src_lens.size()
-
             if target_padding_mask is not None:
                 target_padding_mask = target_padding_mask.t()
-                tgt_len_1, bsz_2 = target_padding_mask.size()
-                assert tgt_len == tgt_len_1
-                assert bsz == bsz_2
 
+        tgt_len, bsz = delays.size()
+        _, bsz_1 = src_lens.size()
         assert bsz == bsz_1
 
+        if target_padding_mask is not None:
+            tgt_len_1, bsz_2 = target_padding_mask.size()
+            assert tgt_len == tgt_len_1
+            assert bsz == bsz_2
+
         if target_padding_mask is None:
             tgt_lens = tgt_len * delays.new_ones([1, bsz]).float()
         else:
@@ -115,6 +116,8 @@ class AverageLagging(LatencyMetric):
         tgt_len, bsz = delays.size()
         lagging_padding_mask = delays >= src_lens
         lagging_padding_mask = torch.nn.functional.pad(lagging_padding_mask.t(), (1, 0)).t()[:-1, :]
+        if target_padding_mask is not None:
+            lagging_padding_mask = lagging_padding_mask | target_padding_mask
         gamma = tgt_lens / src_lens
         lagging = delays - torch.arange(delays.size(0)).unsqueeze(1).type_as(delays).expand_as(delays) / gamma
         lagging.masked_fill_(lagging_padding_mask, 0)
@@ -141,29 +144,19 @@ class DifferentiableAverageLagging(LatencyMetric):
         1. delays_i if i == 1
         2. max(delays_i, delays'_{i-1} + 1 / gamma)
 
+    Unrolling the recurrence, delays'_i = max_{j <= i} delays_j + (i - j) / gamma,
+    so delays'_i - (i - 1) / gamma is the cumulative maximum of
+    delays_j - (j - 1) / gamma.
     """
     @staticmethod
     def cal_metric(delays, src_lens, tgt_lens, target_padding_mask):
         tgt_len, bsz = delays.size()
 
         gamma = tgt_lens / src_lens
-        new_delays = torch.zeros_like(delays)
-
-        for i in range(delays.size(0)):
-            if i == 0:
-                new_delays[i] = delays[i]
-            else:
-                new_delays[i] = torch.cat(
-                    [
-                        new_delays[i - 1].unsqueeze(0) + 1 / gamma,
-                        delays[i].unsqueeze(0)
-                    ],
-                    dim=0
-                ).max(dim=0)[0]
-
         DAL = (
-            new_delays - torch.arange(delays.size(0)).unsqueeze(1).type_as(delays).expand_as(delays) / gamma
+            delays - torch.arange(delays.size(0)).unsqueeze(1).type_as(delays).expand_as(delays) / gamma
         )
+        DAL = torch.cummax(DAL, dim=0)[0]
         if target_padding_mask is not None:
             DAL = DAL.masked_fill(target_padding_mask, 0)
 
@@ -182,11 +175,12 @@ class LatencyInference(object):
 
         self.start_from_zero = start_from_zero
 
-    def __call__(self, monotonic_step, src_lens):
+    def __call__(self, monotonic_step, src_lens, target_padding_mask=None):
         """
         monotonic_step range from 0 to src_len. src_len means eos
         delays: bsz, tgt_len
         src_lens: bsz, 1
+        target_padding_mask: bsz, tgt_len
         """
         if not self.start_from_zero:
             monotonic_step -= 1
@@ -209,7 +203,7 @@ class LatencyInference(object):
         for key, func in self.metric_calculator.items():
             return_dict[key] = func(
                 delays.float(), src_lens.float(),
-                target_padding_mask=None,
+                target_padding_mask=target_padding_mask,
                 batch_first=True,
                 start_from_zero=True
             ).t()
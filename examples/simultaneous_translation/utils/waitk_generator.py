@@ -0,0 +1,197 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import json
+
+import torch
+
+
+class WaitKSequenceGenerator(object):
+    """
+    Offline greedy decoding of a batch of utterances with the wait-k policy
+    of the speech agent (eval/agents/simul_trans_speech_agent.py), instead
+    of reading the source segment by segment from the evaluation server.
+
+    As the agent, each target token is predicted from the source read so
+    far: (number of target tokens in finished words + k) segments of
+    stride * subsampling factor * frame shift ms, or the whole utterance
+    once it is shorter. A target word is sent when the first token of the
+    next word is predicted, and its delay is the source read at that time
+    (ms), so the delays are the ones the server would record for the agent.
+
+    As the agent, the encoder only sees the source read so far: the
+    feature frames of each sentence are encoded incrementally
+    (BerardSimulEncoder.incremental_forward), so the convolutions don't look
+    past the read frames. Given the same features, the hypotheses are the
+    ones of the agent (predict_from_states). The features of the dataset
+    are normalized over whole utterances though, while the agent normalizes
+    the features of the source it received, so the hypotheses can still
+    differ slightly from the ones of the evaluation server.
+
+    Args:
+        tgt_dict (~fairseq.data.Dictionary): target dictionary, with
+            sentencepiece tokens (begin of words start with "▁")
+        max_len (int): maximum number of target tokens, as --max-len of
+            the agent
+        frame_length, frame_shift (float): of the filter bank features (ms)
+        delay_output (str, optional): append the delays of each sentence to
+            this file, in the format of the .delay file of the server
+    """
+
+    def __init__(
+        self, tgt_dict, max_len=150, frame_length=25.0, frame_shift=10.0,
+        delay_output=None,
+    ):
+        self.tgt_dict = tgt_dict
+        self.eos = tgt_dict.eos()
+        self.max_len = max_len
+        self.frame_length = frame_length
+        self.frame_shift = frame_shift
+        self.is_begin_of_word = [
+            symbol.startswith("▁") for symbol in tgt_dict.symbols
+        ]
+        self.delay_output = delay_output
+        if delay_output is not None:
+            # Truncate, the delays of each batch are appended
+            open(delay_output, "w").close()
+
+    def source_lengths_ms(self, src_lengths):
+        """Shortest duration (ms) with src_lengths feature frames"""
+        return self.frame_length + (src_lengths.float() - 1) * self.frame_shift
+
+    def num_read_frames(self, read_ms, src_lengths):
+        """Number of feature frames of the first read_ms of the utterances"""
+        num_frames = (
+            (read_ms - self.frame_length) / self.frame_shift
+        ).floor().long() + 1
+        return num_frames.clamp(min=0).min(src_lengths)
+
+    @torch.no_grad()
+    def generate(self, models, sample, **kwargs):
+        assert len(models) == 1, "ensembles are not supported"
+        model = models[0]
+        model.eval()
+
+        src_tokens = sample["net_input"]["src_tokens"]
+        src_lengths = sample["net_input"]["src_lengths"]
+        bsz = src_lengths.size(0)
+        device = src_lengths.device
+
+        attention = model.decoder.attention
+        subsampling_factor = model.subsampling_factor()
+        segment_ms = attention.segment_size(self.frame_shift, subsampling_factor)
+        src_lengths_ms = self.source_lengths_ms(src_lengths)
+
+        # Number of target tokens in the words sent to the server, which
+        # sets the amount of source read
+        tgt_steps = [0] * bsz
+        tokens = [[] for _ in range(bsz)]
+        scores = [[] for _ in range(bsz)]
+        delays = [[] for _ in range(bsz)]
+        # Number of begin of words and index of the last one, see
+        # SentencePieceModelWordSplitter.update_end_idx_last_full_word
+        num_bow = [0] * bsz
+        last_bow = [0] * bsz
+        finished = [False] * bsz
+        # Cached encoder and attention states of each sentence, as the
+        # model states of the agent
+        model_states = [{} for _ in range(bsz)]
+
+        incremental_state = {}
+        prev_output_tokens = torch.full(
+            (bsz, 1), self.eos, dtype=torch.long, device=device
+        )
+        while not all(finished):
+            read_ms = torch.min(
+                (
+                    (torch.tensor(tgt_steps, device=device) + attention.waitk)
+                    * segment_ms
+                ).float(),
+                src_lengths_ms
+            )
+            num_read_frames = (
+                self.num_read_frames(read_ms, src_lengths).clamp(min=1).tolist()
+            )
+
+            encoder_outs = [
+                model.encoder.incremental_forward(
+                    src_tokens[i: i + 1, : num_read_frames[i]], model_states[i]
+                )
+                for i in range(bsz)
+            ]
+            # The projections of the stable encoder states by the attention
+            # are computed once per sentence
+            encoder_keys = [
+                attention.encoder_keys(
+                    encoder_out["encoder_out"],
+                    model_states[i],
+                    encoder_out["num_stable_frames"],
+                )
+                for i, encoder_out in enumerate(encoder_outs)
+            ]
+            decoder_out, _ = model.decoder(
+                prev_output_tokens,
+                model.collate_encoder_outs(encoder_outs, encoder_keys),
+                incremental_state,
+            )
+            lprobs = model.get_normalized_probs([decoder_out], log_probs=True)
+            # bsz
+            step_scores, predictions = lprobs[:, -1].max(dim=-1)
+
+            for i, index in enumerate(predictions.tolist()):
+                if finished[i]:
+                    continue
+                delay = int(read_ms[i].item())
+                if index == self.eos or len(tokens[i]) > self.max_len:
+                    finished[i] = True
+                    scores[i].append(step_scores[i].item())
+                    # The last word, then the end of sentence
+                    if len(tokens[i]) > tgt_steps[i]:
+                        delays[i].append(delay)
+                    delays[i].append(delay)
+                    continue
+
+                tokens[i].append(index)
+                scores[i].append(step_scores[i].item())
+                if self.is_begin_of_word[index]:
+                    num_bow[i] += 1
+                    last_bow[i] = len(tokens[i]) - 1
+                end_idx_last_full_word = last_bow[i] if num_bow[i] >= 2 else 0
+                if end_idx_last_full_word > tgt_steps[i]:
+                    delays[i].append(delay)
+                    tgt_steps[i] = end_idx_last_full_word
+
+            prev_output_tokens = predictions.unsqueeze(1)
+
+        hypos = []
+        for i in range(bsz):
+            positional_scores = torch.tensor(scores[i])
+            hypos.append(
+                [
+                    {
+                        "tokens": torch.tensor(tokens[i] + [self.eos], dtype=torch.long),
+                        "score": positional_scores.mean().item(),
+                        "positional_scores": positional_scores,
+                        "alignment": None,
+                        "delays": delays[i],
+                        "src_len_ms": int(src_lengths_ms[i].item()),
+                    }
+                ]
+            )
+
+        if self.delay_output is not None:
+            with open(self.delay_output, "a") as f:
+                for sample_id, hypo in zip(sample["id"].tolist(), hypos):
+                    f.write(
+                        json.dumps(
+                            {
+                                "id": sample_id,
+                                "src_len": hypo[0]["src_len_ms"],
+                                "delays": hypo[0]["delays"],
+                            }
+                        ) + "\n"
+                    )
+
+        return hypos
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+from examples.simultaneous_translation.models.berard_simul_trans import (
+    BerardSimulEncoder,
+)
+
+
+class TestIncrementalEncoder(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.encoder = BerardSimulEncoder(
+            input_layers=[32, 16],
+            conv_layers=[(4, 3, 2), (4, 3, 2)],
+            in_channels=1,
+            input_feat_per_channel=8,
+            num_lstm_layers=2,
+            lstm_size=12,
+            dropout=0.0,
+            use_energy=False,
+        )
+        self.encoder.eval()
+
+    def test_incremental_forward_matches_forward(self):
+        src_tokens = torch.randn(1, 37, 8)
+        incremental_state = {}
+        with torch.no_grad():
+            for src_len in [1, 2, 5, 6, 11, 12, 20, 29, 37]:
+                prefix = src_tokens[:, :src_len]
+                expected = self.encoder(prefix, torch.LongTensor([src_len]))
+                incremental = self.encoder.incremental_forward(
+                    prefix, incremental_state
+                )
+                self.assertEqual(
+                    expected["encoder_out"].size(),
+                    incremental["encoder_out"].size()
+                )
+                self.assertTrue(
+                    torch.allclose(
+                        expected["encoder_out"],
+                        incremental["encoder_out"],
+                        atol=1e-5
+                    )
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from examples.simultaneous_translation.data.indexed_arrays import (
+    IndexedArrays,
+    IndexedArraysWriter,
+)
+
+
+class TestIndexedArrays(unittest.TestCase):
+    def test_write_merge_read(self):
+        rng = np.random.RandomState(0)
+        arrays = {
+            "utt-{}".format(i): rng.randn(rng.randint(1, 20), 5).astype(np.float16)
+            for i in range(6)
+        }
+        keys = list(arrays.keys())
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            chunk_prefixes = [os.path.join(tmpdir, "chunk{}".format(i)) for i in range(2)]
+            for chunk_id, chunk_prefix in enumerate(chunk_prefixes):
+                writer = IndexedArraysWriter(chunk_prefix, np.float16, dim=5)
+                for key in keys[chunk_id * 3: (chunk_id + 1) * 3]:
+                    writer.add_item(key, arrays[key])
+                writer.finalize()
+
+            prefix = os.path.join(tmpdir, "merged")
+            writer = IndexedArraysWriter(
+                prefix, np.float16, dim=5, metadata={"frame_shift": 10.0}
+            )
+            for chunk_prefix in chunk_prefixes:
+                writer.merge_file_(chunk_prefix)
+            writer.finalize()
+
+            self.assertTrue(IndexedArrays.exists(prefix))
+            indexed_arrays = IndexedArrays(prefix)
+            self.assertEqual(len(indexed_arrays), len(arrays))
+            self.assertEqual(indexed_arrays.metadata, {"frame_shift": 10.0})
+            for i, key in enumerate(keys):
+                self.assertIn(key, indexed_arrays)
+                np.testing.assert_array_equal(indexed_arrays[i], arrays[key])
+                np.testing.assert_array_equal(indexed_arrays.get(key), arrays[key])
+            del indexed_arrays
+
+
+if __name__ == "__main__":
+    unittest.main()
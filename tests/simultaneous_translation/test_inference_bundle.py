@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+import tempfile
+import unittest
+
+import torch
+from fairseq.data import Dictionary
+from examples.simultaneous_translation.models.berard_simul_trans import (
+    BerardSimulASTModel,
+    berard_simul_ast,
+)
+from examples.simultaneous_translation.utils.inference_bundle import (
+    InferenceBundle,
+    write_bundle,
+)
+
+
+class TestInferenceBundle(unittest.TestCase):
+    def test_write_read(self):
+        torch.manual_seed(0)
+        model_state = {
+            "encoder.weight": torch.randn(4, 3),
+            "decoder.bias": torch.randn(5),
+            "num_updates": torch.tensor(7),
+        }
+        tgt_dict = Dictionary()
+        for symbol in ["▁hallo", "▁welt", "en"]:
+            tgt_dict.add_symbol(symbol)
+        args = argparse.Namespace(arch="berard_simul_text_iwslt", waitk_lagging=3)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prefix = os.path.join(tmpdir, "model.bundle")
+            write_bundle(prefix, args, model_state, {"src": None, "tgt": tgt_dict})
+            self.assertTrue(InferenceBundle.exists(prefix))
+
+            bundle = InferenceBundle(prefix)
+            self.assertEqual(vars(bundle.args), vars(args))
+            self.assertFalse(bundle.quantize)
+            self.assertIsNone(bundle.dictionary("src"))
+            self.assertEqual(bundle.dictionary("tgt").symbols, tgt_dict.symbols)
+
+            state_dict = bundle.state_dict()
+            self.assertEqual(set(state_dict.keys()), set(model_state.keys()))
+            for name, tensor in model_state.items():
+                self.assertEqual(state_dict[name].dtype, tensor.dtype)
+                self.assertTrue(torch.equal(state_dict[name], tensor))
+            del bundle, state_dict
+
+    def test_float16(self):
+        model_state = {"weight": torch.randn(8, 2)}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prefix = os.path.join(tmpdir, "model.bundle")
+            write_bundle(
+                prefix, argparse.Namespace(), model_state, {}, dtype="float16"
+            )
+            bundle = InferenceBundle(prefix)
+            weight = bundle.state_dict()["weight"]
+            self.assertEqual(weight.dtype, torch.float32)
+            self.assertTrue(
+                torch.allclose(weight, model_state["weight"].half().float())
+            )
+            del bundle, weight
+
+    def test_integer_buffers_are_exact(self):
+        model_state = {
+            "weight": torch.randn(3),
+            "num_updates": torch.tensor([123457, -5], dtype=torch.long),
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prefix = os.path.join(tmpdir, "model.bundle")
+            write_bundle(
+                prefix, argparse.Namespace(), model_state, {}, dtype="float16"
+            )
+            bundle = InferenceBundle(prefix)
+            num_updates = bundle.state_dict()["num_updates"]
+            self.assertEqual(num_updates.dtype, torch.long)
+            self.assertTrue(torch.equal(num_updates, model_state["num_updates"]))
+            del bundle
+
+    def test_build_model(self):
+        torch.manual_seed(0)
+        tgt_dict = Dictionary()
+        for symbol in ["▁hallo", "▁welt", "en"]:
+            tgt_dict.add_symbol(symbol)
+        args = argparse.Namespace(
+            arch="berard_simul_ast",
+            input_feat_per_channel=8,
+            input_layers="[16, 12]",
+            conv_layers="[(4, 3, 2), (4, 3, 2)]",
+            num_lstm_layers=2,
+            lstm_size=10,
+            dropout=0.0,
+            decoder_embed_dim=6,
+            decoder_num_layers=2,
+            decoder_hidden_dim=10,
+            attention_dim=10,
+            output_layer_dim=6,
+            simul_type="waitk",
+            waitk_lagging=2,
+            waitk_stride=1,
+        )
+        berard_simul_ast(args)
+        task = argparse.Namespace(
+            source_dictionary=None, target_dictionary=tgt_dict
+        )
+        model = BerardSimulASTModel.build_model(args, task)
+        model.eval()
+
+        src_tokens = torch.randn(2, 21, 8)
+        src_lengths = torch.LongTensor([21, 17])
+        prev_output_tokens = torch.LongTensor([[2, 4, 5, 6], [2, 6, 4, 1]])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prefix = os.path.join(tmpdir, "model.bundle")
+            write_bundle(prefix, args, model.state_dict(), {"tgt": tgt_dict})
+
+            # Same model, loaded from the state dict
+            expected_model = BerardSimulASTModel.build_model(args, task)
+            expected_model.load_state_dict(model.state_dict(), strict=True)
+            expected_model.eval()
+
+            bundle = InferenceBundle(prefix)
+            bundle_model, _ = bundle.build_model()
+            bundle_model.eval()
+
+            with torch.no_grad():
+                expected_encoder_out = expected_model.encoder(src_tokens, src_lengths)
+                expected_decoder_out = expected_model.decoder(
+                    prev_output_tokens, expected_encoder_out
+                )
+                encoder_out = bundle_model.encoder(src_tokens, src_lengths)
+                decoder_out = bundle_model.decoder(prev_output_tokens, encoder_out)
+            self.assertTrue(
+                torch.allclose(
+                    encoder_out["encoder_out"], expected_encoder_out["encoder_out"]
+                )
+            )
+            self.assertTrue(torch.allclose(decoder_out[0], expected_decoder_out[0]))
+            del bundle, bundle_model
+
+
+if __name__ == "__main__":
+    unittest.main()
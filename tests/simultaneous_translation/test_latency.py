@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+from examples.simultaneous_translation.utils.eval_latency import (
+    METRICS,
+    LatencyScorer,
+)
+from examples.simultaneous_translation.utils.latency import (
+    DifferentiableAverageLagging,
+    LatencyInference,
+)
+
+
+class TestLatencyScorer(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.list_of_dict = []
+        for _ in range(20):
+            src_len = int(torch.randint(1, 30, (1,)))
+            tgt_len = int(torch.randint(1, 30, (1,)))
+            delays = torch.randint(1, src_len + 2, (tgt_len,)).sort()[0]
+            self.list_of_dict.append(
+                {"src_len": src_len, "delays": delays.tolist()}
+            )
+
+    def test_batched_scores_match_sentence_scores(self):
+        scorer = LatencyInference()
+        expected = {metric: 0.0 for metric in METRICS}
+        for info in self.list_of_dict:
+            scores = scorer(
+                torch.LongTensor(info["delays"]).unsqueeze(0) - 1,
+                torch.LongTensor([[info["src_len"]]])
+            )
+            for metric in METRICS:
+                expected[metric] += scores[metric][0, 0].item() / len(self.list_of_dict)
+
+        scores = LatencyScorer.score(self.list_of_dict, start_from_zero=False)
+        for metric in METRICS:
+            self.assertAlmostEqual(scores[metric], expected[metric], places=4)
+
+    def test_computation_aware_without_computation_time(self):
+        # Delays within the source, so that they are not clipped
+        list_of_dict = [
+            {
+                "src_len": info["src_len"],
+                "delays": [min(d, info["src_len"]) for d in info["delays"]],
+                "elapsed": [float(min(d, info["src_len"])) for d in info["delays"]],
+            }
+            for info in self.list_of_dict
+        ]
+        scores = LatencyScorer.score(list_of_dict, start_from_zero=False)
+        ca_scores = LatencyScorer.score(
+            list_of_dict, start_from_zero=False, computation_aware=True
+        )
+        for metric in METRICS:
+            self.assertAlmostEqual(ca_scores[metric], scores[metric], places=4)
+
+
+class TestDifferentiableAverageLagging(unittest.TestCase):
+    def test_matches_recurrence(self):
+        torch.manual_seed(0)
+        tgt_len, bsz = 17, 6
+        src_lens = torch.randint(5, 20, (1, bsz)).float()
+        delays = torch.rand(tgt_len, bsz).mul(src_lens).sort(dim=0)[0]
+        delays = delays[torch.randperm(tgt_len)]
+        tgt_lens = torch.randint(1, tgt_len + 1, (1, bsz))
+        target_padding_mask = torch.arange(tgt_len).unsqueeze(1) >= tgt_lens
+        tgt_lens = tgt_lens.float()
+
+        DAL = DifferentiableAverageLagging.cal_metric(
+            delays, src_lens, tgt_lens, target_padding_mask
+        )
+
+        gamma = tgt_lens / src_lens
+        new_delays = torch.zeros_like(delays)
+        for i in range(tgt_len):
+            if i == 0:
+                new_delays[i] = delays[i]
+            else:
+                new_delays[i] = torch.max(new_delays[i - 1] + 1 / gamma, delays[i])
+        expected = (
+            new_delays - torch.arange(tgt_len).unsqueeze(1).float() / gamma
+        ).masked_fill(target_padding_mask, 0).sum(dim=0, keepdim=True) / tgt_lens
+
+        self.assertTrue(torch.allclose(DAL, expected, atol=1e-5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import numpy as np
+import torch
+import torchaudio.compliance.kaldi as kaldi
+from examples.simultaneous_translation.data.streaming_features import (
+    OnlineCMVN,
+    StreamingFbank,
+)
+
+
+class TestStreamingFbank(unittest.TestCase):
+    def test_chunks_match_whole_utterance(self):
+        rng = np.random.RandomState(0)
+        samples = (rng.randn(9000) * 1000).astype(np.float32)
+        expected = kaldi.fbank(
+            torch.from_numpy(samples).unsqueeze(0),
+            num_mel_bins=40,
+            frame_length=25.0,
+            frame_shift=10.0,
+            dither=0.0,
+        )
+
+        # Chunks shorter than a window, and not aligned with the frames
+        streaming_fbank = StreamingFbank(num_mel_bins=40, apply_cmvn=False)
+        outputs = []
+        start = 0
+        for chunk_size in [100, 250, 777, 160, 3000, 1, 4712]:
+            outputs.append(streaming_fbank(samples[start: start + chunk_size]))
+            start += chunk_size
+        self.assertEqual(start, len(samples))
+
+        output = torch.cat(outputs, dim=0)
+        self.assertEqual(output.size(), expected.size())
+        self.assertTrue(torch.allclose(output, expected, atol=1e-4))
+        self.assertTrue(torch.equal(streaming_fbank.get_features(), output))
+
+
+class TestOnlineCMVN(unittest.TestCase):
+    def test_cumulative_statistics(self):
+        torch.manual_seed(0)
+        features = torch.randn(30, 5) * 3 + 2
+
+        cmvn = OnlineCMVN(5)
+        output = torch.cat(
+            [cmvn(features[:1]), cmvn(features[1:12]), cmvn(features[12:])],
+            dim=0
+        )
+
+        # The first frame is its own mean
+        self.assertTrue(torch.allclose(output[0], torch.zeros(5)))
+        for t in range(1, features.size(0)):
+            prefix = features[: t + 1].double()
+            expected = (features[t].double() - prefix.mean(dim=0)) / prefix.std(dim=0)
+            self.assertTrue(
+                torch.allclose(output[t].double(), expected, atol=1e-4)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import unittest
+
+import torch
+from examples.simultaneous_translation.module.waitk_attention import (
+    WaitKAttentionLayer,
+)
+
+
+class TestWaitKMask(unittest.TestCase):
+    def setUp(self):
+        args = argparse.Namespace(
+            decoder_hidden_dim=8,
+            encoder_hidden_size=8,
+            waitk_lagging=3,
+            waitk_stride=2,
+        )
+        self.attention = WaitKAttentionLayer(args)
+
+    def test_waitk_mask(self):
+        tgt_len, src_len = 7, 11
+        mask = self.attention.waitk_mask(tgt_len, src_len)
+        self.assertEqual(mask.size(), (tgt_len, src_len))
+        for i in range(tgt_len):
+            pointer = min((i + 3) * 2, src_len - 1)
+            for j in range(src_len):
+                self.assertEqual(bool(mask[i, j]), j > pointer)
+
+    def test_waitk_mask_per_sentence(self):
+        tgt_len, src_len = 7, 11
+        laggings = torch.LongTensor([1, 3, 5])
+        mask = self.attention.waitk_mask(tgt_len, src_len, laggings)
+        self.assertEqual(mask.size(), (tgt_len, src_len, 3))
+        for b, waitk in enumerate(laggings.tolist()):
+            self.assertTrue(
+                torch.equal(
+                    mask[:, :, b], self.attention.waitk_mask(tgt_len, src_len, waitk)
+                )
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import unittest
+
+import torch
+from fairseq.data import Dictionary
+from examples.simultaneous_translation.models.berard_simul_trans import (
+    BerardSimulASTModel,
+    berard_simul_ast,
+)
+from examples.simultaneous_translation.utils.waitk_generator import (
+    WaitKSequenceGenerator,
+)
+
+
+class TestWaitKSequenceGenerator(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.tgt_dict = Dictionary()
+        for symbol in ["▁das", "▁ist", "▁gut", "en", "er"]:
+            self.tgt_dict.add_symbol(symbol)
+        args = argparse.Namespace(
+            arch="berard_simul_ast",
+            input_feat_per_channel=8,
+            input_layers="[16, 12]",
+            conv_layers="[(4, 3, 2), (4, 3, 2)]",
+            num_lstm_layers=2,
+            lstm_size=10,
+            dropout=0.0,
+            decoder_embed_dim=6,
+            decoder_num_layers=2,
+            decoder_hidden_dim=10,
+            attention_dim=10,
+            output_layer_dim=6,
+            simul_type="waitk",
+            waitk_lagging=1,
+            waitk_stride=1,
+        )
+        berard_simul_ast(args)
+        task = argparse.Namespace(
+            source_dictionary=None, target_dictionary=self.tgt_dict
+        )
+        self.model = BerardSimulASTModel.build_model(args, task)
+        self.model.eval()
+        self.generator = WaitKSequenceGenerator(self.tgt_dict, max_len=12)
+
+    def agent_decode(self, features):
+        """
+        Decode the features of a sentence step by step with the policy of
+        the speech agent and predict_from_states
+        """
+        model = self.model
+        src_len = torch.LongTensor([features.size(0)])
+        src_len_ms = self.generator.source_lengths_ms(src_len)
+        segment_ms = model.decoder.attention.segment_size(
+            self.generator.frame_shift, model.subsampling_factor()
+        )
+        states = {
+            "indices": {"src": None, "tgt": []},
+            "steps": {"src": 0, "tgt": 0},
+            "incremental_encoder": False,
+            "model_states": {},
+        }
+        tokens, delays = [], []
+        num_bow, last_bow = 0, 0
+        while True:
+            read_ms = torch.min(
+                torch.FloatTensor(
+                    [(states["steps"]["tgt"] + model.decoder.attention.waitk) * segment_ms]
+                ),
+                src_len_ms
+            )
+            num_frames = max(self.generator.num_read_frames(read_ms, src_len).item(), 1)
+            states["indices"]["src"] = features[:num_frames]
+            _, index = model.predict_from_states(states)
+            delay = int(read_ms.item())
+
+            if index == self.tgt_dict.eos() or len(tokens) > self.generator.max_len:
+                if len(tokens) > states["steps"]["tgt"]:
+                    delays.append(delay)
+                delays.append(delay)
+                return tokens, delays
+
+            tokens.append(index)
+            states["indices"]["tgt"].append(index)
+            if self.tgt_dict[index].startswith("▁"):
+                num_bow += 1
+                last_bow = len(tokens) - 1
+            end_idx_last_full_word = last_bow if num_bow >= 2 else 0
+            if end_idx_last_full_word > states["steps"]["tgt"]:
+                delays.append(delay)
+                states["steps"]["tgt"] = end_idx_last_full_word
+
+    def test_same_as_agent(self):
+        src_lengths = torch.LongTensor([43, 29])
+        src_tokens = torch.randn(2, 43, 8)
+        src_tokens[1, 29:] = 0
+        sample = {
+            "id": torch.LongTensor([0, 1]),
+            "net_input": {"src_tokens": src_tokens, "src_lengths": src_lengths},
+        }
+
+        hypos = self.generator.generate([self.model], sample)
+
+        for i in range(2):
+            tokens, delays = self.agent_decode(src_tokens[i, : src_lengths[i]])
+            self.assertEqual(hypos[i][0]["tokens"].tolist(), tokens + [self.tgt_dict.eos()])
+            self.assertEqual(hypos[i][0]["delays"], delays)
+
+
+if __name__ == "__main__":
+    unittest.main()